@@ -0,0 +1,188 @@
+"""
+Benchmark `util.find_key`/`util.find_keys`/`util.extract_page`/`util.PathCache` against the previous recursive implementation
+
+Payloads mimic real `UserTweets`/`Followers` pages (20 entries with full tweet, user and media objects, ~120 KB of JSON).
+
+usage: python scripts/bench_find_key.py [pages]
+"""
+import sys
+import timeit
+from pathlib import Path
+
+import orjson
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from twitter.util import find_key, find_keys, extract_page, PathCache
+
+
+def find_key_recursive(obj: any, key: str) -> list:
+    def helper(obj: any, key: str, L: list) -> list:
+        if not obj:
+            return L
+
+        if isinstance(obj, list):
+            for e in obj:
+                L.extend(helper(e, key, []))
+            return L
+
+        if isinstance(obj, dict) and obj.get(key):
+            L.append(obj[key])
+
+        if isinstance(obj, dict) and obj:
+            for k in obj:
+                L.extend(helper(obj[k], key, []))
+        return L
+
+    return helper(obj, key, [])
+
+
+def user(i: int) -> dict:
+    return {
+        '__typename': 'User',
+        'id': f'VXNlcjo{i}',
+        'rest_id': str(i),
+        'affiliates_highlighted_label': {},
+        'has_graduated_access': True,
+        'is_blue_verified': False,
+        'profile_image_shape': 'Circle',
+        'legacy': {
+            'can_dm': False,
+            'created_at': 'Tue Jun 02 20:12:29 +0000 2009',
+            'default_profile': False,
+            'description': 'lorem ipsum dolor sit amet ' * 4,
+            'entities': {'description': {'urls': []}, 'url': {'urls': [
+                {'display_url': 'example.com', 'expanded_url': 'https://example.com', 'url': 'https://t.co/abc', 'indices': [0, 23]}]}},
+            'fast_followers_count': 0,
+            'favourites_count': 12345,
+            'followers_count': 98765,
+            'friends_count': 321,
+            'listed_count': 42,
+            'location': 'Earth',
+            'media_count': 1234,
+            'name': f'User {i}',
+            'normal_followers_count': 98765,
+            'pinned_tweet_ids_str': [str(i * 7)],
+            'profile_banner_url': f'https://pbs.twimg.com/profile_banners/{i}/1690000000',
+            'profile_image_url_https': f'https://pbs.twimg.com/profile_images/{i}/abc_normal.jpg',
+            'screen_name': f'user{i}',
+            'statuses_count': 23456,
+            'translator_type': 'none',
+            'verified': False,
+            'withheld_in_countries': [],
+        },
+    }
+
+
+def tweet(i: int, uid: int) -> dict:
+    media = [{
+        'display_url': 'pic.twitter.com/abc',
+        'expanded_url': f'https://twitter.com/user{uid}/status/{i}/photo/1',
+        'id_str': str(i * 3 + k),
+        'indices': [100, 123],
+        'media_key': f'3_{i * 3 + k}',
+        'media_url_https': f'https://pbs.twimg.com/media/{i}{k}.jpg',
+        'type': 'photo',
+        'url': 'https://t.co/abc',
+        'ext_media_availability': {'status': 'Available'},
+        'features': {s: {'faces': [{'x': 1, 'y': 2, 'h': 3, 'w': 4}]} for s in ('large', 'medium', 'small', 'orig')},
+        'sizes': {s: {'h': 1000, 'w': 1000, 'resize': 'fit'} for s in ('large', 'medium', 'small', 'thumb')},
+        'original_info': {'height': 1000, 'width': 1000, 'focus_rects': [{'x': 0, 'y': 0, 'w': 1000, 'h': 560}] * 4},
+    } for k in range(2)]
+    return {
+        'entryId': f'tweet-{i}',
+        'sortIndex': str(i),
+        'content': {
+            'entryType': 'TimelineTimelineItem',
+            '__typename': 'TimelineTimelineItem',
+            'itemContent': {
+                'itemType': 'TimelineTweet',
+                '__typename': 'TimelineTweet',
+                'tweet_results': {'result': {
+                    '__typename': 'Tweet',
+                    'rest_id': str(i),
+                    'core': {'user_results': {'result': user(uid)}},
+                    'unmention_data': {},
+                    'edit_control': {'edit_tweet_ids': [str(i)], 'editable_until_msecs': '1690000000000', 'is_edit_eligible': True, 'edits_remaining': '5'},
+                    'is_translatable': False,
+                    'views': {'count': '123456', 'state': 'EnabledWithCount'},
+                    'source': '<a href="https://mobile.twitter.com" rel="nofollow">Twitter Web App</a>',
+                    'legacy': {
+                        'bookmark_count': 1,
+                        'bookmarked': False,
+                        'created_at': 'Wed Oct 10 20:19:24 +0000 2018',
+                        'conversation_id_str': str(i),
+                        'display_text_range': [0, 140],
+                        'entities': {'hashtags': [], 'symbols': [], 'user_mentions': [], 'urls': [], 'media': media},
+                        'extended_entities': {'media': media},
+                        'favorite_count': 1000,
+                        'favorited': False,
+                        'full_text': 'lorem ipsum dolor sit amet, consectetur adipiscing elit ' * 2,
+                        'is_quote_status': False,
+                        'lang': 'en',
+                        'possibly_sensitive': False,
+                        'quote_count': 10,
+                        'reply_count': 100,
+                        'retweet_count': 200,
+                        'retweeted': False,
+                        'user_id_str': str(uid),
+                        'id_str': str(i),
+                    },
+                }},
+                'tweetDisplayType': 'Tweet',
+            },
+        },
+    }
+
+
+def page(n: int, start: int = 1_700_000_000_000_000_000) -> dict:
+    entries = [tweet(start + k, 1000 + k % 5) for k in range(20)]
+    entries += [
+        {'entryId': f'cursor-top-{n}', 'sortIndex': '1', 'content': {'entryType': 'TimelineTimelineCursor', 'value': f'top-{n}', 'cursorType': 'Top'}},
+        {'entryId': f'cursor-bottom-{n}', 'sortIndex': '0', 'content': {'entryType': 'TimelineTimelineCursor', 'value': f'bottom-{n}', 'cursorType': 'Bottom'}},
+    ]
+    return {'data': {'user': {'result': {'__typename': 'User', 'timeline_v2': {'timeline': {'instructions': [
+        {'type': 'TimelineClearCache'},
+        {'type': 'TimelineAddEntries', 'entries': entries},
+    ]}}}}}}
+
+
+def bench(label: str, fn: callable, pages: int, number: int = 5) -> float:
+    t = min(timeit.repeat(fn, number=number, repeat=5)) / number / pages
+    print(f'{label:<56} {t * 1e3:8.3f} ms/page')
+    return t
+
+
+def main(pages: int = 20):
+    data = [page(n) for n in range(pages)]
+    size = sum(len(orjson.dumps(d)) for d in data) / pages
+    print(f'{pages} pages, {size / 1024:.0f} KB/page\n')
+
+    keys = ('rest_id', 'entries', 'media')
+    assert all(find_key_recursive(d, k) == find_key(d, k) for d in data for k in keys)
+
+    def run(fn):
+        return lambda: [fn(d) for d in data]
+
+    old = bench('recursive find_key("rest_id")', run(lambda d: find_key_recursive(d, 'rest_id')), pages)
+    new = bench('iterative find_key("rest_id")', run(lambda d: find_key(d, 'rest_id')), pages)
+    old3 = bench(f'recursive find_key x{len(keys)} {keys}', run(lambda d: [find_key_recursive(d, k) for k in keys]), pages)
+    new3 = bench(f'find_keys {keys} (single pass)', run(lambda d: find_keys(d, keys)), pages)
+
+    def paginate_recursive(d):
+        entries = find_key_recursive(d, 'entries')
+        return entries, {x for x in find_key_recursive(d, 'rest_id') if x[0].isnumeric()}
+
+    old_page = bench('recursive cursor + rest_id (previous _paginate)', run(paginate_recursive), pages)
+    new_page = bench('extract_page (single pass)', run(extract_page), pages)
+    paths = PathCache(verify_every=pages)
+    assert all(paths.extract('UserTweets', d) == extract_page(d) for d in data)
+    path_page = bench('PathCache.extract (learned paths)', run(lambda d: paths.extract('UserTweets', d)), pages)
+    print(f'\nsingle key speedup: {old / new:.2f}x')
+    print(f'multi key speedup:  {old3 / new3:.2f}x')
+    print(f'page extract speedup: {old_page / new_page:.2f}x')
+    print(f'learned paths speedup: {old_page / path_page:.2f}x ({paths.hits} hits, {paths.misses} misses)')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
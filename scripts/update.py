@@ -13,10 +13,12 @@ from typing import Generator
 import aiofiles
 import chompjs
 import orjson
-from httpx import AsyncClient, Response, Limits, Client
+from httpx import AsyncClient, Response, Limits
 from selectolax.lexbor import LexborHTMLParser
 from tqdm.asyncio import tqdm_asyncio
 
+from twitter.transport import RetryPolicy, make_async_client, make_client
+
 try:
     get_ipython()
     import nest_asyncio
@@ -111,23 +113,18 @@ _a = 'a.js'
 _base = 'https://abs.twimg.com/responsive-web/client-web'
 
 
-async def backoff(fn: callable, sem: Semaphore, *args, m: int = 20, b: int = 2, max_retries: int = 8, **kwargs) -> any:
+async def backoff(fn: callable, sem: Semaphore, *args, **kwargs) -> any:
+    """ Send a request under the semaphore, transient failures are retried by the client's transport """
     ignore_status_codes = kwargs.pop('ignore_status_codes', [])
-    for i in range(max_retries + 1):
-        try:
-            async with sem:
-                r = await fn(*args, **kwargs)
-                if r.status_code in ignore_status_codes:
-                    return r
-                r.raise_for_status()
+    try:
+        async with sem:
+            r = await fn(*args, **kwargs)
+            if r.status_code in ignore_status_codes:
                 return r
-        except Exception as e:
-            if i == max_retries:
-                logger.warning(f'Max retries exceeded\n{e}')
-                return
-            t = min(random.random() * (b ** i), m)
-            logger.info(f'Retrying in {f"{t:.2f}"} seconds\n{e}')
-            await asyncio.sleep(t)
+            r.raise_for_status()
+            return r
+    except Exception as e:
+        logger.warning(f'Request failed\n{e}')
 
 
 def download(urls: list[str], out: str = 'tmp', sz: int = None, fname_fn: partial = None, **kwargs) -> Generator:
@@ -167,7 +164,7 @@ async def process(fns: Generator, max_connections: int = 2000, **kwargs):
     # tqdm
     desc = kwargs.pop('desc', None)
     sem = Semaphore(max_connections)
-    async with AsyncClient(**client_defaults, **kwargs) as client:
+    async with make_async_client(RetryPolicy(retries=8, max_backoff=20, logger=logger), **client_defaults, **kwargs) as client:
         tasks = (fn(client=client, sem=sem) for fn in fns)
         if desc:
             return await tqdm_asyncio.gather(*tasks, desc=desc)
@@ -208,7 +205,7 @@ def parse_matches(matches: list[tuple]) -> dict:
 
 
 def main():
-    client = Client(headers={'user-agent': random.choice(USER_AGENTS)}, follow_redirects=True, http2=True)
+    client = make_client(headers={'user-agent': random.choice(USER_AGENTS)}, follow_redirects=True, http2=True)
     r1 = client.get('https://x.com')
     PATH_HOMEPAGE.write_text(r1.text)
 
@@ -5,7 +5,7 @@ from pathlib import Path
 install_requires = [
     'aiofiles',
     'nest_asyncio',
-    'httpx',
+    'httpx[http2]',
     'tqdm',
     'orjson',
     'm3u8',
@@ -13,6 +13,11 @@ install_requires = [
     'uvloop; platform_system != "Windows"',
 ]
 
+extras_require = {
+    'frame': ['numpy'],
+    'zstd': ['zstandard'],
+}
+
 about = {}
 exec((Path().cwd() / 'twitter' / '__version__.py').read_text(), about)
 
@@ -467,6 +472,7 @@ setup(
     author_email='trevorhobenshield@gmail.com',
     url='https://github.com/trevorhobenshield/twitter-api-client',
     install_requires=install_requires,
+    extras_require=extras_require,
     keywords='twitter api client async search automation bot scrape',
     packages=find_packages(),
     include_package_data=True,
@@ -15,6 +15,7 @@ from tqdm.asyncio import tqdm_asyncio
 
 from .constants import *
 from .login import login
+from .transport import make_async_client, make_client
 from .util import *
 
 try:
@@ -55,12 +56,12 @@ class Account:
             data = {'json': params}
         else:
             data = {'params': {k: orjson.dumps(v).decode() for k, v in params.items()}}
-        r = self.session.request(
+        r = JSONResponse.from_response(self.session.request(
             method=method,
             url=f'{self.gql_api}/{qid}/{op}',
             headers=get_headers(self.session),
             **data
-        )
+        ))
         self.rate_limits[op] = {k: int(v) for k, v in r.headers.items() if 'rate-limit' in k}
         if self.debug:
             log(self.logger, self.debug, r)
@@ -457,11 +458,12 @@ class Account:
     def _paginate(self, method: str, operation: tuple, variables: dict, limit: int) -> list[dict]:
         initial_data = self.gql(method, operation, variables)
         res = [initial_data]
-        ids = set(find_key(initial_data, 'rest_id'))
+        page = extract_page(initial_data)
+        ids = page.ids()
         dups = 0
         DUP_LIMIT = 3
 
-        cursor = get_cursor(initial_data)
+        cursor = page.cursor
         while (dups < DUP_LIMIT) and cursor:
             prev_len = len(ids)
             if prev_len >= limit:
@@ -469,9 +471,10 @@ class Account:
 
             variables['cursor'] = cursor
             data = self.gql(method, operation, variables)
+            page = extract_page(data)
 
-            cursor = get_cursor(data)
-            ids |= set(find_key(data, 'rest_id'))
+            cursor = page.cursor
+            ids |= page.ids()
 
             if self.debug:
                 self.logger.debug(f'cursor: {cursor}\tunique results: {len(ids)}')
@@ -634,14 +637,14 @@ class Account:
 
         # try validating cookies dict
         if isinstance(cookies, dict) and all(cookies.get(c) for c in {'ct0', 'auth_token'}):
-            _session = Client(cookies=cookies, follow_redirects=True)
+            _session = make_client(cookies=cookies, follow_redirects=True)
             _session._init_with_cookies = True
             _session.headers.update(get_headers(_session))
             return _session
 
         # try validating cookies from file
         if isinstance(cookies, str):
-            _session = Client(cookies=orjson.loads(Path(cookies).read_bytes()), follow_redirects=True)
+            _session = make_client(cookies=orjson.loads(Path(cookies).read_bytes()), follow_redirects=True)
             _session._init_with_cookies = True
             _session.headers.update(get_headers(_session))
             return _session
@@ -695,7 +698,7 @@ class Account:
         async def process(ids):
             limits = Limits(max_connections=100)
             headers, cookies = get_headers(self.session), self.session.cookies
-            async with AsyncClient(limits=limits, headers=headers, cookies=cookies, timeout=20) as c:
+            async with make_async_client(limits=limits, headers=headers, cookies=cookies, timeout=20) as c:
                 return await tqdm_asyncio.gather(*(get(c, _id) for _id in ids), desc="Getting DMs")
 
         if conversation_ids:
@@ -0,0 +1,319 @@
+import argparse
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Generator
+
+import orjson
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SEGMENT_SIZE = 256 * 1024 ** 2  # bytes
+DICT_SIZE = 112 * 1024  # bytes
+TRAIN_SAMPLES = 64  # responses per operation used to train a dictionary
+
+
+@dataclass(slots=True)
+class Record:
+    operation: str
+    variables: dict
+    cursor: str | None
+    segment: str
+    offset: int
+    length: int
+    timestamp: int  # ns
+    codec: str | None = None
+    dict_id: int | None = None  # zstd dictionary the record was compressed with
+
+
+class Segment:
+    """ An open segment file and its sidecar index """
+    __slots__ = ('path', 'fp', 'index', 'size')
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.fp = path.open('ab')
+        self.index = path.with_suffix('.idx').open('ab')
+        self.size = self.fp.tell()
+
+    def close(self):
+        self.fp.close()
+        self.index.close()
+
+
+class Archive:
+    """
+    Append-only archive of raw API responses
+
+    Responses are appended byte for byte (no decode/re-encode) to rotating segment files, one series per operation:
+
+        {root}/{operation}/{time_ns}_{pid}.seg   raw response bodies, newline separated
+        {root}/{operation}/{time_ns}_{pid}.idx   one JSON line per response: variables, cursor, offset, length, timestamp
+
+    Each process writes to its own segments and never reopens old ones, so concurrent scrapers and crashes
+    cannot corrupt existing data. Index lines are written after the data they point to, and entries pointing
+    past the end of a truncated segment are ignored when reading.
+
+    With `compress` (requires `zstandard`), each response is compressed on its own, so records stay randomly
+    accessible. Responses of one operation are extremely repetitive, so a zstd dictionary is trained per operation
+    from its first `train_samples` responses and stored next to the data as `{root}/{operation}/{dict_id}.dict`.
+    Later responses (and later runs) use it. Readers decompress transparently.
+    """
+
+    def __init__(self, root: str | Path = 'data/archive', segment_size: int = SEGMENT_SIZE, compress: bool | int = False,
+                 dict_size: int = DICT_SIZE, train_samples: int = TRAIN_SAMPLES):
+        self.root = Path(root)
+        self.segment_size = segment_size
+        if compress and zstandard is None:
+            raise ImportError('Archive compression requires zstandard, install with: pip install "twitter-api-client[zstd]"')
+        # compression level, `True` picks a level that favours size while keeping up with fetching
+        self.level = 12 if compress is True else int(compress or 0)
+        self.dict_size = dict_size
+        self.train_samples = train_samples
+        self._segments: dict[str, Segment] = {}
+        self._compressors = {}  # operation -> (dict_id, ZstdCompressor)
+        self._samples = {}  # operation -> responses collected for training
+        self._dicts = {}  # (operation, dict_id) -> ZstdCompressionDict, for reading
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def append(self, operation: str, content: bytes, variables: dict = None, cursor: str = None, timestamp: int = None) -> Record:
+        """
+        Append a raw response body
+
+        @param operation: operation name, e.g. "UserTweets"
+        @param content: raw response bytes
+        @param variables: query variables (without the cursor)
+        @param cursor: cursor the response was fetched with
+        @param timestamp: time the response was fetched (ns), defaults to now
+        @return: index record of the stored response
+        """
+        timestamp = timestamp or time.time_ns()
+        with self._lock:
+            codec = dict_id = None
+            data = content
+            if self.level:
+                codec = 'zstd'
+                dict_id, compressor = self._compressor(operation, content)
+                data = compressor.compress(content)
+            seg = self._segment(operation, len(data))
+            offset = seg.size
+            seg.fp.write(data)
+            if not codec:
+                seg.fp.write(b'\n')  # keeps uncompressed segments readable as JSON lines
+            seg.size = seg.fp.tell()
+            record = Record(operation, variables or {}, cursor, seg.path.name, offset, len(data), timestamp, codec, dict_id)
+            entry = {
+                'operation': operation,
+                'variables': record.variables,
+                'cursor': cursor,
+                'offset': offset,
+                'length': record.length,
+                'timestamp': timestamp,
+            }
+            if codec:
+                entry |= {'codec': codec, 'dict': dict_id, 'size': len(content)}
+            seg.index.write(orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE))
+        return record
+
+    def _compressor(self, operation: str, content: bytes) -> tuple:
+        if (c := self._compressors.get(operation)) is None:
+            # reuse the dictionary of a previous run if there is one
+            d = self._latest_dict(operation)
+            c = self._compressors[operation] = (d.dict_id() if d else None, zstandard.ZstdCompressor(level=self.level, dict_data=d))
+        if c[0] is None and (samples := self._samples.setdefault(operation, [])) is not None:
+            samples.append(content)
+            if len(samples) >= self.train_samples:
+                try:
+                    d = self.train(operation, samples)
+                    c = self._compressors[operation] = (d.dict_id(), zstandard.ZstdCompressor(level=self.level, dict_data=d))
+                    del self._samples[operation]
+                except zstandard.ZstdError:
+                    self._samples[operation] = None  # not enough data to train on, keep compressing without a dictionary
+        return c
+
+    def train(self, operation: str, samples: list[bytes]) -> 'zstandard.ZstdCompressionDict':
+        """
+        Train a zstd dictionary for an operation and store it next to its segments
+
+        @param operation: operation name
+        @param samples: raw responses of this operation
+        @return: trained dictionary
+        """
+        d = zstandard.train_dictionary(self.dict_size, samples, level=self.level)
+        out = self.root / operation
+        out.mkdir(parents=True, exist_ok=True)
+        tmp = out / f'{d.dict_id()}.dict.tmp'
+        tmp.write_bytes(d.as_bytes())
+        tmp.replace(out / f'{d.dict_id()}.dict')
+        self._dicts[(operation, d.dict_id())] = d
+        return d
+
+    def _latest_dict(self, operation: str) -> 'zstandard.ZstdCompressionDict | None':
+        paths = sorted((self.root / operation).glob('*.dict'), key=lambda p: p.stat().st_mtime)
+        return self._dict(operation, int(paths[-1].stem)) if paths else None
+
+    def _dict(self, operation: str, dict_id: int) -> 'zstandard.ZstdCompressionDict':
+        if (d := self._dicts.get((operation, dict_id))) is None:
+            d = self._dicts[(operation, dict_id)] = zstandard.ZstdCompressionDict((self.root / operation / f'{dict_id}.dict').read_bytes())
+        return d
+
+    def decode(self, record: Record, data: bytes) -> bytes:
+        """ Decompress the stored bytes of a record, if needed """
+        if record.codec is None:
+            return data
+        if record.codec != 'zstd':
+            raise ValueError(f'Unknown codec: {record.codec}')
+        if zstandard is None:
+            raise ImportError('Reading compressed archives requires zstandard, install with: pip install "twitter-api-client[zstd]"')
+        if record.dict_id is None:
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zstandard.ZstdDecompressor(dict_data=self._dict(record.operation, record.dict_id)).decompress(data)
+
+    def _segment(self, operation: str, n: int) -> Segment:
+        seg = self._segments.get(operation)
+        if seg is not None and seg.size and seg.size + n > self.segment_size:
+            seg.close()
+            seg = None
+        if seg is None:
+            out = self.root / operation
+            out.mkdir(parents=True, exist_ok=True)
+            seg = self._segments[operation] = Segment(out / f'{time.time_ns()}_{os.getpid()}.seg')
+        return seg
+
+    def flush(self) -> None:
+        with self._lock:
+            for seg in self._segments.values():
+                seg.fp.flush()
+                seg.index.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            for seg in self._segments.values():
+                seg.close()
+            self._segments.clear()
+
+    def operations(self) -> list[str]:
+        return sorted(p.name for p in self.root.iterdir() if p.is_dir()) if self.root.exists() else []
+
+    def records(self, operation: str = None) -> Generator[Record, None, None]:
+        """
+        Iterate over index records, oldest segment first
+
+        @param operation: only records of this operation, defaults to all operations
+        @return: generator of records
+        """
+        self.flush()
+        for op in ([operation] if operation else self.operations()):
+            for idx in sorted((self.root / op).glob('*.idx')):
+                size = idx.with_suffix('.seg').stat().st_size
+                for line in idx.read_bytes().splitlines():
+                    try:
+                        e = orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        continue  # partially written line
+                    if e['offset'] + e['length'] > size:
+                        continue  # data was not fully written
+                    yield Record(e['operation'], e['variables'], e['cursor'], idx.with_suffix('.seg').name, e['offset'], e['length'],
+                                 e['timestamp'], e.get('codec'), e.get('dict'))
+
+    def read(self, operation: str = None) -> Generator[tuple[Record, bytes], None, None]:
+        """
+        Iterate over stored responses, compressed records are decompressed transparently
+
+        @param operation: only responses of this operation, defaults to all operations
+        @return: generator of (record, raw response bytes)
+        """
+        fp = name = None
+        try:
+            for rec in self.records(operation):
+                path = self.root / rec.operation / rec.segment
+                if path != name:
+                    if fp:
+                        fp.close()
+                    fp, name = path.open('rb'), path
+                fp.seek(rec.offset)
+                yield rec, self.decode(rec, fp.read(rec.length))
+        finally:
+            if fp:
+                fp.close()
+
+    def load(self, operation: str = None) -> Generator[dict, None, None]:
+        """ Iterate over stored responses as decoded JSON """
+        for _, content in self.read(operation):
+            yield orjson.loads(content)
+
+
+def open_archive(archive: bool | str | Path | Archive, root: str | Path, **kwargs) -> Archive | None:
+    """
+    Resolve the `archive` option of Scraper/Search
+
+    @param archive: False/None to disable, True for the default location, a path, or an existing Archive
+    @param root: default archive root
+    @param kwargs: Archive options, e.g. `compress`
+    @return: Archive or None
+    """
+    if not archive:
+        return None
+    if isinstance(archive, Archive):
+        return archive
+    return Archive(root if archive is True else archive, **kwargs)
+
+
+def compact(src: str | Path = 'data', dst: str | Path = None, delete: bool = False, **kwargs) -> int:
+    """
+    Convert a tree of `{time_ns}_{operation}.json` files written by `save_json` into an `Archive`
+
+    The original variables are not recoverable from the directory layout, so the directory name
+    (joined variable values, or "batch") is stored as `{"path": ...}` instead.
+
+    @param src: root of the existing data tree
+    @param dst: archive root, defaults to `{src}/archive`
+    @param delete: delete each file once it has been archived
+    @return: number of files archived
+    """
+    src = Path(src)
+    dst = Path(dst) if dst else src / 'archive'
+    pattern = re.compile(r'^(\d+)_(\w+)\.json$')
+    files = []
+    for p in src.rglob('*.json'):
+        if dst in p.parents:
+            continue
+        if m := pattern.match(p.name):
+            files.append((int(m[1]), m[2], p))
+    files.sort()
+    n = 0
+    with Archive(dst, **kwargs) as archive:
+        for ts, operation, p in files:
+            archive.append(operation, p.read_bytes(), {'path': str(p.parent.relative_to(src))}, timestamp=ts)
+            n += 1
+        archive.flush()
+        if delete:
+            for *_, p in files:
+                p.unlink()
+            for d in sorted({p.parent for *_, p in files}, key=lambda x: len(x.parts), reverse=True):
+                if d != src and not any(d.iterdir()):
+                    d.rmdir()
+    return n
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compact a data/ tree of saved JSON responses into a segmented archive')
+    parser.add_argument('src', nargs='?', default='data', help='root of the existing data tree')
+    parser.add_argument('-o', '--dst', default=None, help='archive root, defaults to {src}/archive')
+    parser.add_argument('--delete', action='store_true', help='delete the original files once archived')
+    parser.add_argument('--segment-size', type=int, default=SEGMENT_SIZE, help='max segment size in bytes')
+    parser.add_argument('--compress', type=int, nargs='?', const=19, default=0, help='zstd compression level (requires zstandard)')
+    args = parser.parse_args()
+    print(f'Archived {compact(args.src, args.dst, args.delete, segment_size=args.segment_size, compress=args.compress)} files')
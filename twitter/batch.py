@@ -0,0 +1,197 @@
+import asyncio
+from typing import Awaitable, Callable
+
+import orjson
+from httpx import URL
+
+from .constants import MAX_REQUEST_LINE
+from .util import JSONResponse, batch_ids, encode_param, request_template
+
+BATCH_WINDOW = 0.005  # seconds
+MAX_BATCH_SIZE = 220  # ids per request, see readme
+TOO_LARGE = {414, 431}  # URI too long, request header fields too large
+QUOTE, COMMA = len(encode_param('"')), len(encode_param(','))
+
+
+def id_key(operation: tuple) -> str | None:
+    """ Name of the list-valued variable of a batch operation, e.g. `tweetIds` """
+    for k, v in operation[0].items():
+        if v is list or getattr(v, '__origin__', None) is list:
+            return k
+
+
+def merge_responses(parts: list[JSONResponse]) -> JSONResponse:
+    """
+    Combine the responses of a split batch query into one, as if it had been sent whole
+
+    Lists under `data` (e.g. `tweetResult`, `users`) are concatenated in order, responses that failed are skipped.
+    """
+    data, ok = {}, [r for r in parts if r.status_code == 200]
+    for r in ok:
+        try:
+            d = r.json().get('data') or {}
+        except Exception:
+            continue
+        for k, v in d.items():
+            if isinstance(v, list):
+                data.setdefault(k, []).extend(v)
+            else:
+                data.setdefault(k, v)
+    last = (ok or parts)[-1]
+    return JSONResponse(orjson.dumps({'data': data}), last.status_code, last.headers, last.url)
+
+
+class IdBatcher:
+    """
+    Packs ids into batch queries by the size of the request they produce
+
+    The encoded request line (path plus query string, including the quoted and percent-encoded ids and the
+    `features` blob) is measured per operation, and ids are added to a batch until `budget` bytes are reached.
+    When a batch is rejected as too large (414/431) the budget of that operation is lowered, but not below the
+    largest request that went through, unless a request of that size is rejected too.
+    """
+
+    def __init__(self, budget: int = MAX_REQUEST_LINE):
+        self.budget = budget
+        self.limits = {}  # operation -> byte budget, lowered after 414/431
+        self.largest = {}  # operation -> largest request line that succeeded
+        self._base = {}  # operation -> request line size with no ids
+
+    def limit(self, name: str) -> int:
+        return self.limits.get(name, self.budget)
+
+    def base(self, operation: tuple) -> int:
+        name = operation[-1]
+        if (n := self._base.get(name)) is None:
+            n = self._base[name] = len(URL(request_template(operation).url({id_key(operation): []})).raw_path)
+        return n
+
+    def batches(self, operation: tuple, ids: list[int | str]) -> list[list[str]]:
+        """
+        Split ids into batches that fit the request budget of an operation
+
+        @param operation: batch operation, e.g. `Operation.TweetResultsByRestIds`
+        @param ids: ids to look up
+        @return: list of batches, an id too large to fit on its own gets a batch of its own
+        """
+        base, limit = self.base(operation), self.limit(operation[-1])
+        res, batch, size = [], [], base
+        for x in map(str, ids):
+            n = len(x) + 2 * QUOTE if x.isdigit() else len(encode_param(orjson.dumps(x).decode()))
+            if batch:
+                n += COMMA
+                if size + n > limit:
+                    res.append(batch)
+                    batch, size = [], base
+                    n -= COMMA
+            batch.append(x)
+            size += n
+        if batch:
+            res.append(batch)
+        return res
+
+    def succeeded(self, name: str, size: int) -> None:
+        if size > self.largest.get(name, 0):
+            self.largest[name] = size
+            if name in self.limits and size > self.limits[name]:
+                self.limits[name] = size
+
+    def rejected(self, operation: tuple, size: int) -> None:
+        """ A request of `size` bytes was too large, halve the id payload of the budget but keep what is known to work """
+        name = operation[-1]
+        if self.largest.get(name, 0) >= size:
+            self.largest.pop(name)  # the server limit went down, what worked before no longer does
+        half = self.base(operation) + (size - self.base(operation)) // 2
+        self.limits[name] = min(self.limit(name), max(self.largest.get(name, 0), half))
+
+
+class BatchLoader:
+    """
+    Coalesces single lookups into batch requests (DataLoader pattern)
+
+    Every `load` made within `window` seconds, from any coroutine, is queued. The queue is then split with
+    `batch_fn` and each batch is fetched with a single request, and the results are handed back to each caller.
+    Duplicate ids share one slot in the batch. A full batch is dispatched immediately without waiting for the window.
+    If a batch request fails, its error is raised to every caller waiting on it.
+    """
+
+    def __init__(self, fetch: Callable[[list[str]], Awaitable[dict[str, any]]], window: float = BATCH_WINDOW,
+                 max_batch: int = MAX_BATCH_SIZE, batch_fn: Callable[[list[str]], list[list[str]]] = batch_ids):
+        """
+        @param fetch: coroutine function taking a batch of ids and returning a dict of id -> result
+        @param window: seconds to wait for more lookups before dispatching
+        @param max_batch: dispatch as soon as this many distinct ids are queued
+        @param batch_fn: splits queued ids into request-sized batches
+        """
+        self.fetch = fetch
+        self.window = window
+        self.max_batch = max_batch
+        self.batch_fn = batch_fn
+        self.pending: dict[str, list[asyncio.Future]] = {}
+        self.timer = None
+        self.tasks = set()  # batch requests in flight, referenced until done so they are not garbage collected
+        self.requests = 0  # batch requests sent
+        self.loads = 0  # individual lookups served
+
+    async def load(self, _id: int | str) -> any:
+        """
+        Look up a single id
+
+        @param _id: id to look up
+        @return: result for this id, None if the batch response did not contain it
+        @raise: the error of the batch request, if it failed
+        """
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self.pending.setdefault(str(_id), []).append(fut)
+        self.loads += 1
+        if len(self.pending) >= self.max_batch:
+            self._dispatch()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self._dispatch)
+        return await fut
+
+    async def load_many(self, ids: list[int | str]) -> list:
+        return await asyncio.gather(*(self.load(i) for i in ids))
+
+    def _dispatch(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        pending, self.pending = self.pending, {}
+        for batch in self.batch_fn(list(pending)):
+            task = asyncio.create_task(self._run({k: pending[k] for k in batch}))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    def close(self) -> None:
+        """ Cancel queued lookups and batch requests in flight, their callers get `CancelledError` """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        pending, self.pending = self.pending, {}
+        for futs in pending.values():
+            for f in futs:
+                f.cancel()
+        for task in list(self.tasks):
+            task.cancel()
+
+    async def _run(self, batch: dict[str, list[asyncio.Future]]) -> None:
+        self.requests += 1
+        try:
+            results = await self.fetch(list(batch))
+        except asyncio.CancelledError:
+            for futs in batch.values():
+                for f in futs:
+                    f.cancel()
+            raise
+        except Exception as e:
+            for futs in batch.values():
+                for f in futs:
+                    if not f.done():
+                        f.set_exception(e)
+            return
+        for k, futs in batch.items():
+            for f in futs:
+                if not f.done():
+                    f.set_result(results.get(k))
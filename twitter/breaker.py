@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from logging import Logger
+
+import httpx
+
+from .constants import MAGENTA, RED, GREEN, RESET
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+PROBE_POLL = 0.1  # seconds between checks while a half-open probe is in flight
+
+
+class CircuitOpen(httpx.TransportError):
+    """ Raised instead of sending a request while the circuit of its operation is open and `park=False`, or to parked requests when the probe fails """
+
+    def __init__(self, operation: str, retry_in: float):
+        super().__init__(f'{operation} circuit open, retry in {retry_in:.1f}s')
+        self.operation = operation
+        self.retry_in = retry_in
+
+
+class Circuit:
+    __slots__ = ('state', 'outcomes', 'until', 'cooldown', 'probing', 'failed_probes')
+
+    def __init__(self, window: int, cooldown: float):
+        self.state = CLOSED
+        self.outcomes = deque(maxlen=window)  # True for success
+        self.until = 0.0  # end of the open period
+        self.cooldown = cooldown
+        self.probing = False
+        self.failed_probes = 0  # parked requests give up when this changes
+
+
+class CircuitBreaker:
+    """
+    Per-operation circuit breaker for 429/5xx storms
+
+    Outcomes of the last `window` requests are kept per operation, where an outcome is the final one after any retries.
+    Once at least `min_calls` are recorded and the share of failures (429, 5xx, transport errors) reaches `threshold`,
+    the circuit opens for `cooldown` seconds. While open, requests of that operation are parked (`park=True`) or fail
+    fast with `CircuitOpen`. After the cooldown a single probe request is let through (half-open). Success closes the
+    circuit and releases every parked request. Failure reopens it with the cooldown doubled, up to `max_cooldown`, and
+    fails every request parked so far with `CircuitOpen`, so work queued on a broken operation drains in one cooldown.
+    """
+
+    def __init__(self, threshold: float = 0.5, window: int = 20, min_calls: int = 10, cooldown: float = 30.0,
+                 max_cooldown: float = 600.0, park: bool = True, logger: Logger = None):
+        self.threshold = threshold
+        self.window = window
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.park = park
+        self.logger = logger
+        self.circuits: dict[str, Circuit] = {}
+        self.metrics = {}  # operation -> {'state', 'opened', 'rejected', 'parked'}
+        self._lock = threading.Lock()
+
+    def _circuit(self, op: str) -> Circuit:
+        if (c := self.circuits.get(op)) is None:
+            c = self.circuits[op] = Circuit(self.window, self.cooldown)
+            self.metrics[op] = {'state': CLOSED, 'opened': 0, 'rejected': 0, 'parked': 0}
+        return c
+
+    def _set(self, op: str, c: Circuit, state: str, reason: str = '') -> None:
+        c.state = self.metrics[op]['state'] = state
+        if state == OPEN:
+            self.metrics[op]['opened'] += 1
+        if self.logger:
+            color = {OPEN: RED, HALF_OPEN: MAGENTA, CLOSED: GREEN}[state]
+            self.logger.warning(f'{op} circuit {color}{state}{RESET}{f" ({reason})" if reason else ""}')
+
+    def state(self, op: str) -> str:
+        with self._lock:
+            return self._circuit(op).state
+
+    def check(self, op: str, parked: int = None) -> tuple[float, bool, int]:
+        """
+        Ask to send a request
+
+        @param op: operation name
+        @param parked: failed probe count returned when the request was first parked, None if it is not parked
+        @return: (seconds to wait before asking again, 0 if the request may be sent now;
+                  whether it is the half-open probe; failed probe count to pass back when asking again)
+        """
+        with self._lock:
+            c = self._circuit(op)
+            if c.state == CLOSED:
+                return 0.0, False, c.failed_probes
+            now = time.time()
+            wait = max(c.until - now, 0.0) if c.state == OPEN else PROBE_POLL
+            if not self.park or (parked is not None and parked != c.failed_probes):
+                # fail fast, or a probe failed while this request was parked
+                self.metrics[op]['rejected'] += 1
+                raise CircuitOpen(op, wait)
+            if c.state == OPEN and now >= c.until:
+                self._set(op, c, HALF_OPEN, 'sending probe')
+            if c.state == HALF_OPEN and not c.probing:
+                c.probing = True
+                return 0.0, True, c.failed_probes
+            return wait or PROBE_POLL, False, c.failed_probes
+
+    def record(self, op: str, ok: bool | None, probe: bool = False) -> None:
+        """
+        Report the final outcome of a request
+
+        @param op: operation name
+        @param ok: True on success, False on failure, None if the request was abandoned (e.g. cancelled)
+        @param probe: whether the request was the half-open probe
+        """
+        with self._lock:
+            c = self._circuit(op)
+            if probe:
+                c.probing = False
+                if ok:
+                    c.outcomes.clear()
+                    c.cooldown = self.cooldown
+                    self._set(op, c, CLOSED, 'probe succeeded')
+                elif ok is False:
+                    c.failed_probes += 1
+                    c.cooldown = min(c.cooldown * 2, self.max_cooldown)
+                    c.until = time.time() + c.cooldown
+                    self._set(op, c, OPEN, f'probe failed, next probe in {c.cooldown:g}s')
+                return
+            if ok is None or c.state != CLOSED:
+                # requests sent before the circuit opened don't decide anything, only the probe does
+                return
+            c.outcomes.append(ok)
+            n = len(c.outcomes)
+            if n >= self.min_calls and (failed := n - sum(c.outcomes)) / n >= self.threshold:
+                c.until = time.time() + c.cooldown
+                self._set(op, c, OPEN, f'{failed}/{n} failed, next probe in {c.cooldown:g}s')
+
+    async def wait(self, op: str) -> bool:
+        """ Wait until a request of `op` may be sent, returns whether it is the probe, raises `CircuitOpen` if the probe fails """
+        parked = None
+        while True:
+            t, probe, failed_probes = self.check(op, parked)
+            if not t:
+                return probe
+            if parked is None:
+                parked = failed_probes
+                with self._lock:
+                    self.metrics[op]['parked'] += 1
+            await asyncio.sleep(t)
+
+    def wait_sync(self, op: str) -> bool:
+        """ Blocking version of `wait` """
+        parked = None
+        while True:
+            t, probe, failed_probes = self.check(op, parked)
+            if not t:
+                return probe
+            if parked is None:
+                parked = failed_probes
+                with self._lock:
+                    self.metrics[op]['parked'] += 1
+            time.sleep(t)
+
+
+def failed(response: httpx.Response) -> bool:
+    """ Whether a final response counts as a failure of its operation """
+    return response.status_code == 429 or response.status_code >= 500
+
+
+def open_breaker(breaker: bool | dict | CircuitBreaker, logger: Logger = None) -> CircuitBreaker | None:
+    """
+    Resolve the `breaker` option of Scraper
+
+    @param breaker: False/None to disable, True for the defaults, a dict of CircuitBreaker options, or an existing CircuitBreaker
+    @param logger: logger for state changes
+    @return: CircuitBreaker or None
+    """
+    if not breaker:
+        return None
+    if isinstance(breaker, CircuitBreaker):
+        return breaker
+    return CircuitBreaker(**(breaker if isinstance(breaker, dict) else {}), logger=logger)
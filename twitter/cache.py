@@ -0,0 +1,194 @@
+import asyncio
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import orjson
+
+from .constants import SpaceState
+from .util import JSONResponse
+
+# seconds, operations not listed here are not cached unless configured
+DEFAULT_TTLS = {
+    'UserByScreenName': 15 * 60,
+    'UserByRestId': 15 * 60,
+    'UsersByRestIds': 15 * 60,
+    'ProfileSpotlightsQuery': 15 * 60,
+    'TweetResultByRestId': 5 * 60,
+    'TweetResultsByRestIds': 5 * 60,
+    'AudioSpaceById': 60,
+}
+
+FINAL_SPACE_STATES = {SpaceState.Ended, SpaceState.Canceled, SpaceState.TimedOut}
+FINAL_TWEET_TYPES = {'TweetTombstone', 'TweetUnavailable'}
+CASE_INSENSITIVE = {'screen_name'}  # variables whose values are compared case-insensitively by the API
+
+
+def cache_key(name: str, variables: dict) -> str:
+    """
+    Operation name plus normalized variables
+
+    Keys are sorted and scalar values stringified, so `{"userId": 123}` and `{"userId": "123"}` share an entry.
+    Screen names are lower-cased, the API treats them case-insensitively.
+    """
+    norm = {k: v if isinstance(v, list | dict) else str(v).lower() if k in CASE_INSENSITIVE else str(v) for k, v in variables.items()}
+    return f'{name}:{orjson.dumps(norm, option=orjson.OPT_SORT_KEYS).decode()}'
+
+
+def is_final(name: str, data: dict) -> bool:
+    """ Responses that can never change: ended spaces and deleted/unavailable tweets """
+    data = data.get('data') or {}
+    if name == 'AudioSpaceById':
+        state = ((data.get('audioSpace') or {}).get('metadata') or {}).get('state')
+        return state in FINAL_SPACE_STATES
+    if name == 'TweetResultByRestId':
+        result = (data.get('tweetResult') or {}).get('result') or {}
+        return result.get('__typename') in FINAL_TWEET_TYPES
+    return False
+
+
+class MemoryCache:
+    """ In-memory LRU of (content, expires at) """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+
+    def get(self, key: str) -> tuple[bytes, float] | None:
+        if (v := self.data.get(key)) is not None:
+            self.data.move_to_end(key)
+        return v
+
+    def set(self, key: str, content: bytes, expires: float) -> None:
+        self.data[key] = (content, expires)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self.data.pop(key, None)
+
+
+class SQLiteCache:
+    """ On-disk cache shared by all jobs using the same file """
+
+    def __init__(self, path: str | Path = 'data/cache.db'):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, content BLOB, expires REAL)')
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> tuple[bytes, float] | None:
+        with self.lock:
+            row = self.conn.execute('SELECT content, expires FROM cache WHERE key = ?', (key,)).fetchone()
+        return (row[0], row[1] if row[1] is not None else math.inf) if row else None
+
+    def set(self, key: str, content: bytes, expires: float) -> None:
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)', (key, content, None if expires == math.inf else expires))
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self.conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def purge(self) -> None:
+        """ Remove expired entries """
+        with self.lock:
+            self.conn.execute('DELETE FROM cache WHERE expires < ?', (time.time(),))
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class ResponseCache:
+    """
+    Response cache in front of the network, keyed by operation name and normalized variables
+
+    An in-memory LRU is always used, an optional SQLite file adds a persistent second tier shared across jobs.
+    Each operation has its own TTL (`DEFAULT_TTLS`, overridable with `ttl`), operations with no TTL are not cached.
+    Ended spaces and deleted tweets never change, so they are kept forever.
+    """
+
+    def __init__(self, ttl: dict[str, float] = None, maxsize: int = 4096, path: str | Path = None):
+        self.ttls = DEFAULT_TTLS | (ttl or {})
+        self.memory = MemoryCache(maxsize)
+        self.disk = SQLiteCache(path) if path else None
+        self.stats = {}  # operation -> {'hits': int, 'misses': int}
+
+    @property
+    def hits(self) -> int:
+        return sum(s['hits'] for s in self.stats.values())
+
+    @property
+    def misses(self) -> int:
+        return sum(s['misses'] for s in self.stats.values())
+
+    def enabled(self, name: str) -> bool:
+        return self.ttls.get(name, 0) > 0
+
+    def _count(self, name: str, hit: bool) -> None:
+        s = self.stats.setdefault(name, {'hits': 0, 'misses': 0})
+        s['hits' if hit else 'misses'] += 1
+
+    async def get(self, name: str, variables: dict) -> JSONResponse | None:
+        """
+        Look up a cached response
+
+        @param name: operation name
+        @param variables: query variables
+        @return: cached response, or None on a miss
+        """
+        key = cache_key(name, variables)
+        v = self.memory.get(key)
+        if v is None and self.disk:
+            if (v := await asyncio.to_thread(self.disk.get, key)) is not None:
+                self.memory.set(key, *v)
+        if v is not None and v[1] < time.time():
+            self.memory.delete(key)
+            v = None
+        self._count(name, v is not None)
+        return JSONResponse(v[0]) if v is not None else None
+
+    async def set(self, name: str, variables: dict, r: JSONResponse) -> None:
+        """
+        Store a successful response
+
+        @param name: operation name
+        @param variables: query variables
+        @param r: response
+        """
+        try:
+            data = r.json()
+        except orjson.JSONDecodeError:
+            return
+        if r.status_code != 200 or not isinstance(data, dict) or data.get('errors'):
+            return
+        expires = math.inf if is_final(name, data) else time.time() + self.ttls.get(name, 0)
+        key = cache_key(name, variables)
+        self.memory.set(key, r.content, expires)
+        if self.disk:
+            await asyncio.to_thread(self.disk.set, key, r.content, expires)
+
+    def close(self) -> None:
+        if self.disk:
+            self.disk.close()
+
+
+def open_cache(cache: bool | str | Path | ResponseCache, **kwargs) -> ResponseCache | None:
+    """
+    Resolve the `cache` option of Scraper
+
+    @param cache: False/None to disable, True for in-memory only, a path to add a SQLite backend, or an existing ResponseCache
+    @param kwargs: ResponseCache options, e.g. `ttl`
+    @return: ResponseCache or None
+    """
+    if not cache:
+        return None
+    if isinstance(cache, ResponseCache):
+        return cache
+    return ResponseCache(path=None if cache is True else cache, **kwargs)
@@ -0,0 +1,135 @@
+import asyncio
+import random
+import threading
+from urllib.parse import urlsplit
+
+from httpx import AsyncClient, Client, Limits
+
+from .constants import API_HOSTS, MEDIA_HOSTS, MAX_ENDPOINT_LIMIT, USER_AGENTS
+from .transport import RetryPolicy, make_async_client
+from .util import get_headers
+
+# headers derived from session cookies
+AUTH_HEADERS = ('cookie', 'x-csrf-token', 'x-guest-token', 'x-twitter-auth-type')
+
+
+class ClientManager:
+    """
+    Long-lived HTTP clients and event loop owned by a `Scraper`
+
+    One HTTP/2 connection pool is kept per API/media host, so TLS handshakes and warm connections
+    are reused across calls instead of being rebuilt for every `users()`, `tweets()`, `download_media()`, etc.
+    Any other host (chat endpoints, live stream playlists) shares a single default pool.
+
+    Synchronous callers submit coroutines with `run`, which executes them on one persistent event loop
+    running in a background thread. Async callers can use `get` directly from their own loop.
+
+    Every client retries transient failures through the `retry` policy, see `transport.RetryPolicy`. API clients also
+    go through the `breaker`, if given, which stops sending requests of an operation that keeps failing.
+    """
+
+    def __init__(self, session: Client = None, guest: bool = False, **kwargs):
+        self.session = session
+        self.guest = guest
+        self.http2 = kwargs.get('http2', True)
+        self.timeout = kwargs.get('timeout', 20)
+        self.limits = Limits(
+            max_connections=kwargs.get('max_connections', MAX_ENDPOINT_LIMIT),
+            max_keepalive_connections=kwargs.get('max_keepalive_connections', None),
+            keepalive_expiry=kwargs.get('keepalive_expiry', 30.0),
+        )
+        self.retry = kwargs.get('retry') or RetryPolicy()
+        self.breaker = kwargs.get('breaker')
+        self._clients = {}
+        self._loop = None
+        self._thread = None
+        self.closed = False
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self.closed:
+            raise RuntimeError('ClientManager is closed')
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name='twitter-client-loop', daemon=True)
+            self._thread.start()
+        return self._loop
+
+    def run(self, coro):
+        """ Run a coroutine on the persistent event loop and wait for its result """
+        if self.closed:
+            coro.close()
+            raise RuntimeError('ClientManager is closed')
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def get(self, url: str, session: Client = None) -> AsyncClient:
+        """
+        Get the shared client for a url or host
+
+        @param url: full url or bare host name
+        @param session: authenticated session to send requests as, defaults to the manager's session
+        @return: long-lived AsyncClient for this host
+        """
+        host = urlsplit(url).hostname if '://' in url else url
+        if host not in API_HOSTS and host not in MEDIA_HOSTS:
+            host = None
+        # media hosts are public, all other pools are bound to the session's cookies
+        key = host if host in MEDIA_HOSTS else (host, session or self.session)
+        if (client := self._clients.get(key)) is None:
+            client = self._clients[key] = self._create(host, session or self.session)
+        return client
+
+    def _create(self, host: str | None, session: Client = None) -> AsyncClient:
+        if host in MEDIA_HOSTS:
+            # public CDN, no need to send auth headers or cookies
+            return make_async_client(
+                self.retry,
+                limits=self.limits,
+                headers={'user-agent': random.choice(USER_AGENTS)},
+                http2=self.http2,
+                verify=False,
+                timeout=60,
+                follow_redirects=True,
+            )
+        headers = session.headers if self.guest else get_headers(session)
+        cookies = session.cookies if session else None
+
+        async def auth(request):
+            # clients outlive the cookies they were built with, auth headers follow the session's current cookies
+            current = session.headers if self.guest else get_headers(session)
+            request.headers.update({k: current[k] for k in AUTH_HEADERS if k in current})
+
+        return make_async_client(self.retry, self.breaker, limits=self.limits, headers=headers, cookies=cookies, http2=self.http2,
+                                 timeout=self.timeout, event_hooks={'request': [auth]} if session else None)
+
+    async def preconnect(self, hosts: tuple = API_HOSTS + MEDIA_HOSTS) -> None:
+        """
+        Open connections ahead of time so the first real request does not pay for the TLS handshake
+
+        @param hosts: hosts to connect to
+        @return: None
+        """
+
+        async def connect(host: str):
+            try:
+                await self.get(host).head(f'https://{host}/')
+            except Exception:
+                ...
+
+        await asyncio.gather(*(connect(h) for h in hosts))
+
+    async def aclose(self) -> None:
+        clients, self._clients = list(self._clients.values()), {}
+        await asyncio.gather(*(c.aclose() for c in clients), return_exceptions=True)
+
+    def close(self) -> None:
+        """ Close all clients and stop the event loop, the manager can not be used afterwards """
+        if self._loop is None:
+            self.closed = True
+            return
+        self.run(self.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = self._thread = None
+        self.closed = True
@@ -2,8 +2,19 @@ from dataclasses import dataclass
 
 # todo: not accurate measure. value will decrease as new gql features/variables are required. (actual limitation is request size, i.e. new gql features an variables contribute to total request size)
 MAX_GQL_CHAR_LIMIT = 4_200
+# encoded path + query string of a GraphQL GET request, batch queries are packed up to this size
+MAX_REQUEST_LINE = 9_216  # bytes
 
 MAX_ENDPOINT_LIMIT = 500  # 500/15 mins
+# pages a streamed crawl fetches ahead of its consumer, fetched or in flight
+STREAM_PREFETCH = 16
+
+# user timelines ordered newest first, these can be crawled incrementally
+INCREMENTAL_OPERATIONS = {'UserTweets', 'UserTweetsAndReplies', 'UserMedia'}
+
+# hosts that get their own long-lived HTTP/2 connection pool
+API_HOSTS = ('twitter.com', 'api.twitter.com')
+MEDIA_HOSTS = ('video.twimg.com', 'pbs.twimg.com')
 
 MAX_IMAGE_SIZE = 5_242_880  # ~5 MB
 MAX_GIF_SIZE = 15_728_640  # ~15 MB
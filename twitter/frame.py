@@ -0,0 +1,294 @@
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError('TweetFrame requires numpy, install with: pip install "twitter-api-client[frame]"') from e
+
+from .models import TWITTER_DATE_FORMAT, Tweet, iter_nodes
+
+TWITTER_EPOCH = 1288834974657  # ms, snowflake ids encode their creation time relative to this
+SNOWFLAKE_MIN = 1 << 32  # tweet ids below this predate snowflake ids
+
+COLUMNS = {
+    'id': np.int64,
+    'author_id': np.int64,
+    'created_at': 'datetime64[ms]',
+    'favorite_count': np.int32,
+    'retweet_count': np.int32,
+    'reply_count': np.int32,
+    'quote_count': np.int32,
+    'lang': np.int16,  # codes into `TweetFrame.langs`, -1 if missing
+}
+COUNTS = ('favorite_count', 'retweet_count', 'reply_count', 'quote_count')
+
+
+def _created_at(tid: int, created_at: str | datetime | None) -> int | None:
+    """ Creation time in ms, read from the snowflake id when possible (much cheaper than parsing the date string) """
+    if tid >= SNOWFLAKE_MIN:
+        return (tid >> 22) + TWITTER_EPOCH
+    try:
+        if not isinstance(created_at, datetime):
+            created_at = datetime.strptime(created_at, TWITTER_DATE_FORMAT)
+        return int(created_at.timestamp() * 1000)
+    except (TypeError, ValueError):
+        return None
+
+
+class TweetFrame:
+    """
+    Columnar, append-only table of tweets backed by typed NumPy arrays
+
+    Tweets are appended straight from GraphQL responses (or `Tweet` models) into preallocated columns,
+    no per-tweet dicts are built. Columns grow by doubling.
+
+    - `id`, `author_id`: int64
+    - `favorite_count`, `retweet_count`, `reply_count`, `quote_count`: int32
+    - `created_at`: datetime64[ms]
+    - `lang`: int16 codes into `langs` (dictionary-encoded)
+    - text: utf-8 bytes buffer plus int64 offsets (Arrow `large_string` layout)
+
+    Columns are returned as views, so `to_arrow`/`to_pandas` hand them over without copying.
+    Rows are never modified once appended, so views stay valid as the frame grows.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.langs = []
+        self._lang_codes = {}
+        self._cols = {k: np.empty(capacity, dtype=v) for k, v in COLUMNS.items()}
+        self._offsets = np.zeros(capacity + 1, dtype=np.int64)
+        self._text = np.empty(capacity * 64, dtype=np.uint8)
+        self._ids = set()
+
+    @classmethod
+    def from_responses(cls, data: dict | list, capacity: int = 1024) -> 'TweetFrame':
+        """
+        Build a frame from raw GraphQL response data, e.g. the output of `scraper.tweets()`
+
+        @param data: GraphQL response data (single response or list of responses)
+        @param capacity: initial number of rows to allocate
+        @return: TweetFrame
+        """
+        frame = cls(capacity)
+        frame.extend(data)
+        return frame
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __repr__(self) -> str:
+        return f'TweetFrame(rows={self.size}, langs={len(self.langs)}, text_bytes={self._offsets[self.size]})'
+
+    def __getitem__(self, key: str | np.ndarray | slice) -> 'np.ndarray | TweetFrame':
+        """ Column by name, or a new frame with the rows selected by a boolean mask, index array or slice """
+        if isinstance(key, str):
+            return self._cols[key][:self.size]
+        return self.take(np.arange(self.size)[key])
+
+    @property
+    def columns(self) -> list[str]:
+        return [*COLUMNS, 'text']
+
+    @property
+    def text_offsets(self) -> np.ndarray:
+        return self._offsets[:self.size + 1]
+
+    @property
+    def text_bytes(self) -> np.ndarray:
+        return self._text[:self._offsets[self.size]]
+
+    def text(self, i: int) -> str:
+        """ Decode the text of a single row """
+        return self._text[self._offsets[i]:self._offsets[i + 1]].tobytes().decode()
+
+    def texts(self) -> list[str]:
+        """ Decode all text, materializes one str per row """
+        buf, off = self.text_bytes.tobytes(), self.text_offsets.tolist()
+        return [buf[a:b].decode() for a, b in zip(off, off[1:])]
+
+    def extend(self, data: dict | list) -> int:
+        """
+        Append every top-level tweet found in GraphQL response data. Tweets already in the frame are skipped.
+
+        @param data: GraphQL response data (single response or list of responses)
+        @return: number of rows added
+        """
+        n = self.size
+        for is_user, node in iter_nodes(data):
+            if not is_user:
+                self.append_node(node)
+        return self.size - n
+
+    def append(self, tweet: Tweet) -> None:
+        """ Append a `Tweet` model """
+        self._append(tweet.id, tweet.author_id, _created_at(tweet.id, tweet.created_at),
+                     (tweet.favorite_count, tweet.retweet_count, tweet.reply_count, tweet.quote_count), tweet.lang, tweet.text)
+
+    def append_node(self, node: dict) -> None:
+        """ Append a raw GraphQL tweet node (`Tweet` or `TweetWithVisibilityResults`) """
+        node = node.get('tweet') or node
+        legacy = node.get('legacy') or {}
+        try:
+            tid = int(node.get('rest_id') or legacy['id_str'])
+        except (KeyError, TypeError, ValueError):
+            return  # tombstone, no data
+        note = ((node.get('note_tweet') or {}).get('note_tweet_results') or {}).get('result') or {}
+        self._append(
+            tid,
+            int(legacy.get('user_id_str') or 0),
+            _created_at(tid, legacy.get('created_at')),
+            (legacy.get('favorite_count'), legacy.get('retweet_count'), legacy.get('reply_count'), legacy.get('quote_count')),
+            legacy.get('lang'),
+            note.get('text') or legacy.get('full_text'),
+        )
+
+    def _append(self, tid: int, author_id: int, created_at: int | None, counts: tuple, lang: str | None, text: str | None) -> None:
+        if tid in self._ids:
+            return
+        self._ids.add(tid)
+        i = self.size
+        if i == len(self._cols['id']):
+            self._grow(2 * i or 1024)
+        cols = self._cols
+        cols['id'][i] = tid
+        cols['author_id'][i] = author_id or 0
+        cols['created_at'][i] = np.datetime64(created_at, 'ms') if created_at is not None else np.datetime64('NaT')
+        for k, v in zip(COUNTS, counts):
+            cols[k][i] = v or 0
+        if lang is None:
+            code = -1  # null
+        elif (code := self._lang_codes.get(lang)) is None:
+            code = self._lang_codes[lang] = len(self.langs)
+            self.langs.append(lang)
+        cols['lang'][i] = code
+        b = (text or '').encode()
+        start = self._offsets[i]
+        end = start + len(b)
+        if end > len(self._text):
+            self._text = self._resize(self._text, max(2 * len(self._text), end))
+        self._text[start:end] = np.frombuffer(b, dtype=np.uint8)
+        self._offsets[i + 1] = end
+        self.size += 1
+
+    @staticmethod
+    def _resize(a: np.ndarray, n: int) -> np.ndarray:
+        # always allocate a new array, previously returned views must stay valid
+        b = np.empty(n, dtype=a.dtype)
+        b[:len(a)] = a
+        return b
+
+    def _grow(self, capacity: int) -> None:
+        self._cols = {k: self._resize(v, capacity) for k, v in self._cols.items()}
+        self._offsets = self._resize(self._offsets, capacity + 1)
+
+    def take(self, idx: np.ndarray) -> 'TweetFrame':
+        """
+        New frame with the given rows, e.g. `frame.take(np.flatnonzero(mask))`
+
+        @param idx: row indices
+        @return: TweetFrame
+        """
+        idx = np.asarray(idx, dtype=np.int64)
+        out = TweetFrame(0)
+        out.size = len(idx)
+        out.langs = self.langs.copy()
+        out._lang_codes = self._lang_codes.copy()
+        out._cols = {k: v[:self.size][idx] for k, v in self._cols.items()}
+        starts, ends = self._offsets[idx], self._offsets[idx + 1]
+        lengths = ends - starts
+        out._offsets = np.zeros(len(idx) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=out._offsets[1:])
+        # gather every selected byte range in one vectorized pass
+        pos = np.arange(out._offsets[-1], dtype=np.int64) - np.repeat(out._offsets[:-1] - starts, lengths)
+        out._text = self._text[pos]
+        out._ids = set(out._cols['id'].tolist())
+        return out
+
+    def lang_is(self, *langs: str) -> np.ndarray:
+        """ Boolean mask of rows in any of the given languages """
+        codes = [self._lang_codes[x] for x in langs if x in self._lang_codes]
+        return np.isin(self['lang'], codes)
+
+    def contains(self, s: str) -> np.ndarray:
+        """
+        Boolean mask of rows whose text contains a substring (case-sensitive)
+
+        Searches the whole text buffer at once and maps matches back to rows, no per-row strings are built.
+        """
+        needle = s.encode()
+        buf = self.text_bytes.tobytes()
+        hits = []
+        i = buf.find(needle)
+        while i != -1:
+            hits.append(i)
+            i = buf.find(needle, i + 1)
+        mask = np.zeros(self.size, dtype=bool)
+        if hits:
+            hits = np.array(hits, dtype=np.int64)
+            rows = np.searchsorted(self.text_offsets, hits, side='right') - 1
+            # a match must not run past the end of its row
+            ok = hits + len(needle) <= self.text_offsets[rows + 1]
+            mask[rows[ok]] = True
+        return mask
+
+    def aggregate(self, by: str, column: str = None, func: str = 'sum') -> tuple[np.ndarray, np.ndarray]:
+        """
+        Group rows by a column and aggregate another one
+
+        @param by: column to group by, e.g. "author_id" or "lang"
+        @param column: column to aggregate, not needed for "count"
+        @param func: one of "count", "sum", "mean", "min", "max"
+        @return: (unique keys, aggregated values)
+        """
+        keys, inverse = np.unique(self[by], return_inverse=True)
+        if func == 'count':
+            return keys, np.bincount(inverse, minlength=len(keys))
+        values = self[column]
+        if func == 'sum':
+            return keys, np.bincount(inverse, weights=values, minlength=len(keys)).astype(np.int64)
+        if func == 'mean':
+            return keys, np.bincount(inverse, weights=values, minlength=len(keys)) / np.bincount(inverse, minlength=len(keys))
+        if func in ('min', 'max'):
+            ufunc = np.minimum if func == 'min' else np.maximum
+            info = np.iinfo(values.dtype)
+            out = np.full(len(keys), info.max if func == 'min' else info.min, dtype=values.dtype)
+            ufunc.at(out, inverse, values)
+            return keys, out
+        raise ValueError(f'Unknown aggregate function: {func}')
+
+    def to_arrow(self):
+        """
+        Zero-copy conversion to a `pyarrow.Table`
+
+        @return: pyarrow.Table, `lang` is dictionary-encoded and `text` is a large_string column
+        """
+        import pyarrow as pa
+
+        n = self.size
+        arrays = {k: pa.array(self[k]) for k in COLUMNS if k != 'lang'}
+        codes = self['lang']
+        arrays['lang'] = pa.DictionaryArray.from_arrays(pa.array(codes, mask=codes < 0), pa.array(self.langs, type=pa.string()))
+        arrays['text'] = pa.LargeStringArray.from_buffers(n, pa.py_buffer(self.text_offsets), pa.py_buffer(self.text_bytes))
+        return pa.table(arrays)
+
+    def to_pandas(self):
+        """
+        Convert to a `pandas.DataFrame` without copying numeric columns
+
+        `lang` becomes a Categorical. `text` is Arrow-backed when pyarrow is installed, otherwise it is decoded to str objects.
+
+        @return: pandas.DataFrame
+        """
+        import pandas as pd
+
+        df = pd.DataFrame({k: self[k] for k in COLUMNS if k != 'lang'}, copy=False)
+        df['lang'] = pd.Categorical.from_codes(self['lang'], categories=pd.Index(self.langs, dtype=object))
+        try:
+            import pyarrow as pa
+
+            text = pa.LargeStringArray.from_buffers(self.size, pa.py_buffer(self.text_offsets), pa.py_buffer(self.text_bytes))
+            df['text'] = pd.Series(text, dtype=pd.ArrowDtype(pa.large_string()))
+        except ImportError:
+            df['text'] = self.texts()
+        return df
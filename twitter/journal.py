@@ -0,0 +1,131 @@
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from .cache import cache_key
+
+
+@dataclass(slots=True)
+class Checkpoint:
+    cursor: str | None
+    pages: int  # pages fetched so far
+    results: int  # unique results fetched so far
+    done: bool
+
+
+class Journal:
+    """
+    Crash-safe checkpoint journal for resumable crawls
+
+    Records, per job and (operation, query), the latest cursor, the number of pages and results fetched and whether
+    the cursor chain is finished. Checkpoints are written after the page they describe, so after a crash a query
+    resumes from the last page that was saved and no finished query is requested again.
+
+    Also holds the high-water marks of incremental crawls: the newest tweet id seen per (operation, query).
+    The database is only created once a job uses it.
+    """
+
+    def __init__(self, path: str | Path = 'data/journal.db'):
+        self.path = Path(path)
+        self._conn = None
+        self.lock = threading.Lock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS checkpoints ('
+                'job TEXT, key TEXT, operation TEXT, cursor TEXT, pages INTEGER, results INTEGER, done INTEGER, updated REAL, '
+                'PRIMARY KEY (job, key))'
+            )
+            self._conn.execute('CREATE TABLE IF NOT EXISTS marks (key TEXT PRIMARY KEY, operation TEXT, tweet_id INTEGER, updated REAL)')
+        return self._conn
+
+    def get(self, job: str, operation: str, query: dict) -> Checkpoint | None:
+        """
+        Latest checkpoint of a query
+
+        @param job: job id
+        @param operation: operation name
+        @param query: query variables, without the cursor
+        @return: checkpoint, or None if the query was never started
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT cursor, pages, results, done FROM checkpoints WHERE job = ? AND key = ?',
+                                    (job, cache_key(operation, query))).fetchone()
+        return Checkpoint(row[0], row[1], row[2], bool(row[3])) if row else None
+
+    def update(self, job: str, operation: str, query: dict, cursor: str | None, pages: int, results: int, done: bool = False) -> None:
+        """ Record progress of a query, committed immediately """
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                              (job, cache_key(operation, query), operation, cursor, pages, results, int(done), time.time()))
+
+    def progress(self, job: str) -> dict[str, dict]:
+        """
+        Summary of a job
+
+        @param job: job id
+        @return: dict of operation -> {'done': int, 'pending': int, 'pages': int}
+        """
+        with self.lock:
+            rows = self.conn.execute('SELECT operation, done, COUNT(*), SUM(pages) FROM checkpoints WHERE job = ? GROUP BY operation, done',
+                                     (job,)).fetchall()
+        res = {}
+        for op, done, n, pages in rows:
+            s = res.setdefault(op, {'done': 0, 'pending': 0, 'pages': 0})
+            s['done' if done else 'pending'] += n
+            s['pages'] += pages or 0
+        return res
+
+    def mark(self, operation: str, query: dict) -> int:
+        """
+        High-water mark of a query
+
+        @param operation: operation name
+        @param query: query variables, without the cursor
+        @return: newest tweet id seen by previous complete crawls, 0 if none
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT tweet_id FROM marks WHERE key = ?', (cache_key(operation, query),)).fetchone()
+        return row[0] if row else 0
+
+    def set_mark(self, operation: str, query: dict, tweet_id: int) -> None:
+        """ Raise the high-water mark of a query, a lower id never moves it back """
+        with self.lock:
+            self.conn.execute(
+                'INSERT INTO marks VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET tweet_id = MAX(tweet_id, excluded.tweet_id), updated = excluded.updated',
+                (cache_key(operation, query), operation, tweet_id, time.time()),
+            )
+
+    def clear(self, job: str) -> None:
+        """ Forget all checkpoints of a job """
+        with self.lock:
+            self.conn.execute('DELETE FROM checkpoints WHERE job = ?', (job,))
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def open_journal(journal: bool | str | Path | Journal, root: str | Path) -> Journal | None:
+    """
+    Resolve the `journal` option of Scraper
+
+    @param journal: False/None to disable, True for the default location, a path, or an existing Journal
+    @param root: default journal path
+    @return: Journal or None
+    """
+    if not journal:
+        return None
+    if isinstance(journal, Journal):
+        return journal
+    return Journal(root if journal is True else journal)
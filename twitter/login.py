@@ -4,6 +4,7 @@ import sys
 from httpx import Client
 
 from .constants import YELLOW, RED, BOLD, RESET, USER_AGENTS
+from .transport import make_client
 from .util import find_key
 
 def update_token(client: Client, key: str, url: str, **kwargs) -> Client:
@@ -147,7 +148,7 @@ def execute_login_flow(client: Client, **kwargs) -> Client | None:
 
 
 def login(email: str, username: str, password: str, **kwargs) -> Client:
-    client = Client(
+    client = make_client(
         cookies={
             "email": email,
             "username": username,
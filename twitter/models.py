@@ -0,0 +1,222 @@
+import zlib
+from datetime import datetime
+
+import orjson
+
+TWITTER_DATE_FORMAT = '%a %b %d %H:%M:%S %z %Y'
+
+TWEET_TYPES = {'Tweet', 'TweetWithVisibilityResults', 'TweetTombstone'}
+
+
+def _date(s: str | None) -> datetime | None:
+    try:
+        return datetime.strptime(s, TWITTER_DATE_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def _int(x) -> int | None:
+    try:
+        return int(x)
+    except (TypeError, ValueError):
+        return None
+
+
+class Model:
+    """
+    Base class for compact GraphQL models
+
+    Only the projected fields are kept, decoded into slots, so a model costs a few hundred bytes plus its text.
+    With `raw=True` the original node is also kept as compressed JSON bytes, and any field of the node's `legacy`
+    object, or of the node itself, is then available as an attribute (decoded on every access).
+    """
+    __slots__ = ('_raw',)
+
+    def __init__(self, node: dict, raw: bool = False):
+        self._raw = zlib.compress(orjson.dumps(node), 1) if raw else None
+
+    @property
+    def raw(self) -> dict | None:
+        """ Original GraphQL node, None unless the model was built with `raw=True` """
+        return None if self._raw is None else orjson.loads(zlib.decompress(self._raw))
+
+    def __getattr__(self, name: str):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._raw is None:
+            raise AttributeError(f'{type(self).__name__!r} object has no attribute {name!r} (build it with raw=True to keep all fields)')
+        node = self.raw
+        legacy = node.get('legacy') or {}
+        if name in legacy:
+            return legacy[name]
+        if name in node:
+            return node[name]
+        raise AttributeError(f'{type(self).__name__!r} object has no attribute {name!r}')
+
+    def __getstate__(self):
+        return {k: getattr(self, k) for cls in type(self).__mro__ for k in getattr(cls, '__slots__', ())}
+
+    def __setstate__(self, state: dict):
+        for k, v in state.items():
+            object.__setattr__(self, k, v)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.id == other.id
+
+    def __hash__(self):
+        return hash((type(self).__name__, self.id))
+
+
+class Media(Model):
+    __slots__ = ('id', 'key', 'type', 'url', 'width', 'height', 'video_url')
+
+    def __init__(self, node: dict, raw: bool = False):
+        super().__init__(node, raw)
+        self.id = _int(node.get('id_str'))
+        self.key = node.get('media_key')
+        self.type = node.get('type')
+        self.url = node.get('media_url_https')
+        info = node.get('original_info') or {}
+        self.width = info.get('width')
+        self.height = info.get('height')
+        # highest bitrate variant of videos and gifs
+        variants = (node.get('video_info') or {}).get('variants')
+        self.video_url = max(variants, key=lambda v: v.get('bitrate', 0)).get('url') if variants else None
+
+    @property
+    def best_url(self) -> str | None:
+        """ Highest bitrate video variant, or the original size image """
+        return self.video_url or (f'{self.url}?name=orig' if self.url else None)
+
+    def __repr__(self):
+        return f'Media(id={self.id}, type={self.type!r}, url={self.url!r})'
+
+
+class User(Model):
+    __slots__ = ('id', 'screen_name', 'name', 'created_at', 'followers_count', 'friends_count',
+                 'statuses_count', 'favourites_count', 'media_count', 'listed_count', 'verified')
+
+    def __init__(self, node: dict, raw: bool = False):
+        super().__init__(node, raw)
+        legacy = node.get('legacy') or {}
+        core = node.get('core') or {}  # newer responses moved some fields out of `legacy`
+        self.id = _int(node.get('rest_id'))
+        self.screen_name = core.get('screen_name') or legacy.get('screen_name')
+        self.name = core.get('name') or legacy.get('name')
+        self.created_at = _date(core.get('created_at') or legacy.get('created_at'))
+        self.followers_count = legacy.get('followers_count')
+        self.friends_count = legacy.get('friends_count')
+        self.statuses_count = legacy.get('statuses_count')
+        self.favourites_count = legacy.get('favourites_count')
+        self.media_count = legacy.get('media_count')
+        self.listed_count = legacy.get('listed_count')
+        self.verified = bool(legacy.get('verified') or node.get('is_blue_verified'))
+
+    def __repr__(self):
+        return f'User(id={self.id}, screen_name={self.screen_name!r})'
+
+
+def _shared_user(node: dict, raw: bool, users: dict | None) -> User:
+    # authors are shared between the tweets of one parse, a timeline mostly repeats the same few users
+    if users is None:
+        return User(node, raw)
+    key = node.get('rest_id')
+    if (user := users.get(key)) is None:
+        user = users[key] = User(node, raw)
+    return user
+
+
+class Tweet(Model):
+    __slots__ = ('id', 'author_id', 'created_at', 'text', 'conversation_id', 'reply_to_id', 'lang',
+                 'favorite_count', 'retweet_count', 'reply_count', 'quote_count', 'bookmark_count', 'view_count',
+                 'author', 'media', 'quoted', 'retweeted')
+
+    def __init__(self, node: dict, raw: bool = False, users: dict = None):
+        """
+        @param node: GraphQL tweet node
+        @param raw: also keep the compressed node, for access to fields that are not projected
+        @param users: user id -> User, authors found here are reused instead of built again
+        """
+        # TweetWithVisibilityResults wraps the actual tweet
+        node = node.get('tweet') or node
+        super().__init__(node, raw)
+        legacy = node.get('legacy') or {}
+        self.id = _int(node.get('rest_id') or legacy.get('id_str'))
+        self.author_id = _int(legacy.get('user_id_str'))
+        self.created_at = _date(legacy.get('created_at'))
+        # long tweets are truncated in `legacy`
+        note = ((node.get('note_tweet') or {}).get('note_tweet_results') or {}).get('result') or {}
+        self.text = note.get('text') or legacy.get('full_text')
+        self.conversation_id = _int(legacy.get('conversation_id_str'))
+        self.reply_to_id = _int(legacy.get('in_reply_to_status_id_str'))
+        self.lang = legacy.get('lang')
+        self.favorite_count = legacy.get('favorite_count')
+        self.retweet_count = legacy.get('retweet_count')
+        self.reply_count = legacy.get('reply_count')
+        self.quote_count = legacy.get('quote_count')
+        self.bookmark_count = legacy.get('bookmark_count')
+        self.view_count = _int((node.get('views') or {}).get('count'))
+        author = ((node.get('core') or {}).get('user_results') or {}).get('result')
+        self.author = _shared_user(author, raw, users) if author else None
+        media = (legacy.get('extended_entities') or legacy.get('entities') or {}).get('media') or ()
+        self.media = tuple(Media(m, raw) for m in media)
+        quoted = (node.get('quoted_status_result') or {}).get('result')
+        self.quoted = Tweet(quoted, raw, users) if quoted else None
+        retweeted = (legacy.get('retweeted_status_result') or {}).get('result')
+        self.retweeted = Tweet(retweeted, raw, users) if retweeted else None
+
+    def __repr__(self):
+        return f'Tweet(id={self.id}, author_id={self.author_id}, text={(self.text or "")[:40]!r})'
+
+
+def iter_nodes(data: dict | list):
+    """
+    Yield every top-level tweet and user node in GraphQL response data, in document order
+
+    Nodes nested inside a tweet (its author, quoted tweet, retweet) are not yielded separately.
+
+    @param data: GraphQL response data (single response or list of responses)
+    @return: generator of (is_user, node)
+    """
+    stack = [data]
+    pop, push = stack.pop, stack.append
+    while stack:
+        o = pop()
+        if type(o) is dict:
+            typename = o.get('__typename')
+            if typename in TWEET_TYPES:
+                yield False, o
+                continue
+            # a user node wrapping a timeline is a container, not a result
+            if typename == 'User' and 'rest_id' in o and not any(k.startswith('timeline') for k in o):
+                yield True, o
+                continue
+            children = o.values()
+        elif type(o) is list:
+            children = o
+        else:
+            continue
+        for v in reversed(children):
+            if type(v) is dict or type(v) is list:
+                push(v)
+
+
+def parse_models(data: dict | list, raw: bool = False) -> list[Tweet | User]:
+    """
+    Build models from every top-level tweet and user node in GraphQL response data
+
+    Nested nodes are available through `Tweet.author`, `Tweet.quoted` and `Tweet.retweeted`, authors are shared.
+
+    @param data: GraphQL response data (single response or list of responses)
+    @param raw: also keep each compressed node, for access to fields that are not projected
+    @return: list of Tweet and User models in document order, without duplicates
+    """
+    res = []
+    seen = set()
+    users = {}
+    for is_user, node in iter_nodes(data):
+        model = _shared_user(node, raw, users) if is_user else Tweet(node, raw, users)
+        if model.id is not None and (key := (is_user, model.id)) not in seen:
+            seen.add(key)
+            res.append(model)
+    return res
@@ -0,0 +1,46 @@
+from logging import Logger
+
+from httpx import Client
+
+from .ratelimit import RateLimiter
+
+
+class PooledSession:
+    __slots__ = ('session', 'limiter', 'rate_limits', 'active')
+
+    def __init__(self, session: Client, logger: Logger = None):
+        self.session = session
+        self.limiter = RateLimiter(logger)
+        self.rate_limits = {}
+        self.active = 0  # pagination chains currently pinned to this session
+
+
+class SessionPool:
+    """
+    Pool of authenticated sessions (one per account)
+
+    Rate limits are tracked per account, so spreading pagination chains over N accounts
+    multiplies throughput by roughly N. A chain is pinned to one session for its whole
+    lifetime because cursors are only valid for the session that produced them.
+    """
+
+    def __init__(self, sessions: list[Client], logger: Logger = None):
+        self.members = [PooledSession(s, logger) for s in sessions]
+
+    def __len__(self):
+        return len(self.members)
+
+    def checkout(self, name: str) -> PooledSession:
+        """
+        Pick the session with the most remaining budget for an operation
+
+        @param name: operation name
+        @return: pooled session, must be returned with `checkin`
+        """
+        member = max(self.members, key=lambda m: (m.limiter.remaining(name) - m.active, -m.active))
+        member.active += 1
+        return member
+
+    @staticmethod
+    def checkin(member: PooledSession) -> None:
+        member.active -= 1
@@ -0,0 +1,99 @@
+import asyncio
+import math
+import time
+from logging import Logger
+
+from .constants import MAGENTA, RESET
+
+RATE_LIMIT_WINDOW = 15 * 60  # seconds
+
+
+class Bucket:
+    __slots__ = ('limit', 'remaining', 'reset', 'in_flight', 'cond')
+
+    def __init__(self):
+        self.limit = None
+        self.remaining = None  # unknown until the first response arrives
+        self.reset = 0.0
+        self.in_flight = 0
+        self.cond = asyncio.Condition()
+
+    def take(self) -> bool:
+        if self.remaining is None:
+            # budget unknown, only let a single probe request through
+            return self.in_flight == 0
+        if self.limit is not None and time.time() >= self.reset:
+            # new window
+            self.remaining = self.limit - self.in_flight
+            self.reset = time.time() + RATE_LIMIT_WINDOW
+        if self.remaining > 0:
+            self.remaining -= 1
+            return True
+        return False
+
+    def delay(self) -> float | None:
+        if self.remaining is None:
+            return None
+        return max(self.reset - time.time(), 0) + 1
+
+
+class RateLimiter:
+    """
+    Per-operation token bucket fed by the `x-rate-limit-*` response headers
+
+    Requests are dispatched while an operation has budget left. Once it runs out, callers sleep until
+    `x-rate-limit-reset` and the bucket is refilled, so arbitrarily large query lists can be processed
+    without tripping 429s or dropping queries.
+    """
+
+    def __init__(self, logger: Logger = None):
+        self.logger = logger
+        self.buckets: dict[str, Bucket] = {}
+
+    def _bucket(self, name: str) -> Bucket:
+        if (b := self.buckets.get(name)) is None:
+            b = self.buckets[name] = Bucket()
+        return b
+
+    def remaining(self, name: str) -> float:
+        """ Requests left for this operation in the current window, `inf` if unknown """
+        b = self.buckets.get(name)
+        if b is None or b.remaining is None:
+            return math.inf
+        if b.limit is not None and time.time() >= b.reset:
+            return b.limit
+        return b.remaining
+
+    async def acquire(self, name: str) -> None:
+        b = self._bucket(name)
+        async with b.cond:
+            while not b.take():
+                delay = b.delay()
+                if delay and self.logger:
+                    self.logger.debug(f'{name} rate limit reached, waiting {MAGENTA}{delay / 60:.2f}{RESET} minutes')
+                try:
+                    await asyncio.wait_for(b.cond.wait(), delay)
+                except asyncio.TimeoutError:
+                    ...
+            b.in_flight += 1
+
+    async def release(self, name: str, headers: dict = None) -> None:
+        b = self._bucket(name)
+        async with b.cond:
+            b.in_flight -= 1
+            if headers is not None:
+                self.update(name, headers)
+            b.cond.notify_all()
+
+    def update(self, name: str, headers: dict) -> None:
+        b = self._bucket(name)
+        try:
+            remaining = int(headers['x-rate-limit-remaining'])
+            b.limit = int(headers.get('x-rate-limit-limit', remaining))
+            b.reset = float(headers.get('x-rate-limit-reset', time.time() + RATE_LIMIT_WINDOW))
+            # requests still in flight were sent after the server computed this value
+            b.remaining = remaining - b.in_flight
+        except (KeyError, ValueError):
+            if b.remaining is None:
+                # endpoint does not report rate limits
+                b.remaining = math.inf
@@ -3,24 +3,32 @@ import logging.config
 import math
 import platform
 import sys
-from functools import partial
+import weakref
+from collections.abc import AsyncGenerator, AsyncIterable, Iterable, Sized
+from contextlib import aclosing
+from functools import partial, wraps
+from itertools import chain
 from typing import Generator
 
 import websockets
 from httpx import AsyncClient, Limits, ReadTimeout, URL
 from tqdm.asyncio import tqdm_asyncio
 
+from .archive import open_archive
+from .batch import BATCH_WINDOW, TOO_LARGE, BatchLoader, IdBatcher, id_key, merge_responses
+from .breaker import open_breaker
+from .cache import open_cache
+from .client import ClientManager
 from .constants import *
+from .journal import open_journal
 from .login import login
+from .models import parse_models
+from .pool import PooledSession, SessionPool
+from .seen import CAPACITY, open_seen
+from .transport import RetryPolicy, make_async_client, make_client
+from .userindex import MAX_AGE, find_users, open_user_index
 from .util import *
-
-try:
-    if get_ipython().__class__.__name__ == 'ZMQInteractiveShell':
-        import nest_asyncio
-
-        nest_asyncio.apply()
-except:
-    ...
+from .writer import Writer
 
 if platform.system() != 'Windows':
     try:
@@ -31,18 +39,97 @@ if platform.system() != 'Windows':
         ...
 
 
-class Scraper:
+class AsyncScraper:
+    """
+    Asynchronous scraper, all public methods are coroutines
+
+    Safe to use inside an already running event loop (aiohttp/FastAPI workers, notebooks),
+    many concurrent jobs can share one instance.
+
+    ```python
+    async with AsyncScraper(cookies='twitter.cookies') as scraper:
+        users = await scraper.users(['elonmusk'])
+    ```
+    """
+
     def __init__(self, email: str = None, username: str = None, password: str = None, session: Client = None, **kwargs):
         self.save = kwargs.get('save', True)
         self.debug = kwargs.get('debug', 0)
         self.pbar = kwargs.get('pbar', True)
         self.out = Path(kwargs.get('out', 'data'))
-        self.guest = False
+        # append raw responses to segment files instead of writing one JSON file per response
+        self.archive = open_archive(kwargs.get('archive'), self.out / 'archive', compress=kwargs.get('compress', False))
         self.logger = self._init_logger(**kwargs)
-        self.session = self._validate_session(email, username, password, session, **kwargs)
+        # all disk output goes through one background writer, `fsync` is the durability cadence in seconds
+        self.writer = Writer(kwargs.get('write_queue', 1024), fsync=kwargs.get('fsync'), logger=self.logger)
+        # in-memory response cache (True), plus a SQLite file if a path is given
+        self.cache = open_cache(kwargs.get('cache', True), ttl=kwargs.get('cache_ttl'), maxsize=kwargs.get('cache_size', 4096))
+        # screen_name <-> user id index filled from every user object seen, in-memory (True) or a SQLite file
+        self.user_index = open_user_index(kwargs.get('user_index', True), max_age=kwargs.get('user_index_max_age', MAX_AGE))
+        # checkpoints of `resume=<job id>` crawls, the file is created on first use
+        self.journal = open_journal(kwargs.get('journal', True), self.out / 'journal.db')
+        # ids of tweets/users already fetched by any run, known ones are dropped from timeline pages before saving
+        self.seen = open_seen(kwargs.get('seen'), self.out / 'seen', capacity=kwargs.get('seen_capacity', CAPACITY))
+        self.guest = False
+        cookies = kwargs.get('cookies')
+        if isinstance(cookies, list | tuple):
+            # multiple accounts, e.g. `cookies=['a.cookies', {"ct0": ..., "auth_token": ...}]`
+            sessions = [self._validate_session(None, None, None, None, cookies=c) for c in cookies]
+        else:
+            sessions = [self._validate_session(email, username, password, session, **kwargs)]
+        sessions.extend(kwargs.get('sessions', []))
+        self.session = sessions[0]
+        self.pool = SessionPool(sessions, self.logger)
         self.rate_limits = {}
-
-    def users(self, screen_names: list[str], **kwargs) -> list[dict]:
+        # return Tweet/User models instead of raw GraphQL dicts, `models='raw'` also keeps each compressed node
+        self.models = kwargs.get('models', False)
+        # JSON paths to cursors/entries/ids learned from the first page of each operation
+        self.paths = PathCache(kwargs.get('verify_paths', 100))
+        # max concurrent pagination chains, either a single value or {operation name: value}
+        self.concurrency = kwargs.get('concurrency', MAX_ENDPOINT_LIMIT)
+        # transient failures (5xx, timeouts, dropped connections, short 429s) are retried by every client, see `transport.RetryPolicy`
+        self.retry = kwargs.get('retry') or RetryPolicy(logger=self.logger if self.debug else None)
+        # operations that keep failing (429/5xx) after retries are paused, queued requests are parked until a probe succeeds
+        self.breaker = open_breaker(kwargs.get('breaker', True), self.logger)
+        self.clients = ClientManager(self.session, self.guest, **(kwargs | {'retry': self.retry, 'breaker': self.breaker}))
+        # batch queries are packed up to `max_request_line` encoded bytes, and split if still rejected as too large
+        self.batcher = IdBatcher(kwargs.get('max_request_line', MAX_REQUEST_LINE))
+        # single id lookups made within `batch_window` seconds are coalesced into batch requests
+        window = kwargs.get('batch_window', BATCH_WINDOW)
+        self.loaders = {
+            'tweets': BatchLoader(partial(self._fetch_batch, Operation.TweetResultsByRestIds, 'tweetResult'), window,
+                                  batch_fn=partial(self.batcher.batches, Operation.TweetResultsByRestIds)),
+            'users': BatchLoader(partial(self._fetch_batch, Operation.UsersByRestIds, 'users'), window,
+                                 batch_fn=partial(self.batcher.batches, Operation.UsersByRestIds)),
+        }
+        self._preconnect = kwargs.get('preconnect', False)
+
+    async def __aenter__(self):
+        if self._preconnect:
+            await self.clients.preconnect()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """ Finish pending writes, close the shared HTTP clients and every store """
+        for loader in self.loaders.values():
+            loader.close()
+        await self.writer.aclose()
+        await self.clients.aclose()
+        if self.cache:
+            self.cache.close()
+        if self.user_index is not None:
+            self.user_index.close()
+        if self.journal:
+            self.journal.close()
+        if self.seen is not None:
+            self.seen.close()
+        if self.archive:
+            self.archive.close()
+
+    async def users(self, screen_names: list[str], **kwargs) -> list[dict]:
         """
         Get user data by screen names.
 
@@ -50,19 +137,24 @@ class Scraper:
         @param kwargs: optional keyword arguments
         @return: list of user data as dicts
         """
-        return self._run(Operation.UserByScreenName, screen_names, **kwargs)
+        return await self._run(Operation.UserByScreenName, screen_names, **kwargs)
 
-    def tweets_by_id(self, tweet_ids: list[int | str], **kwargs) -> list[dict]:
+    async def tweets_by_id(self, tweet_ids: list[int | str], **kwargs) -> list[dict]:
         """
         Get tweet metadata by tweet ids.
 
+        Lookups are coalesced into `TweetResultsByRestIds` batches, together with any concurrent `load_tweet` calls.
+        Pass `batch=False` (or extra query variables) to send one `TweetResultByRestId` request per id instead.
+
         @param tweet_ids: list of tweet ids
         @param kwargs: optional keyword arguments
         @return: list of tweet data as dicts
         """
-        return self._run(Operation.TweetResultByRestId, tweet_ids, **kwargs)
+        if kwargs.pop('batch', True) and kwargs.keys() <= {'models'}:
+            return await self._load_all(self.load_tweet, tweet_ids, **kwargs)
+        return await self._run(Operation.TweetResultByRestId, tweet_ids, **kwargs)
 
-    def tweets_by_ids(self, tweet_ids: list[int | str], **kwargs) -> list[dict]:
+    async def tweets_by_ids(self, tweet_ids: list[int | str], **kwargs) -> list[dict]:
         """
         Get tweet metadata by tweet ids.
 
@@ -72,9 +164,9 @@ class Scraper:
         @param kwargs: optional keyword arguments
         @return: list of tweet data as dicts
         """
-        return self._run(Operation.TweetResultsByRestIds, batch_ids(tweet_ids), **kwargs)
+        return await self._run(Operation.TweetResultsByRestIds, self.batcher.batches(Operation.TweetResultsByRestIds, tweet_ids), **kwargs)
 
-    def tweets_details(self, tweet_ids: list[int], **kwargs) -> list[dict]:
+    async def tweets_details(self, tweet_ids: list[int], **kwargs) -> list[dict]:
         """
         Get tweet data by tweet ids.
 
@@ -84,45 +176,48 @@ class Scraper:
         @param kwargs: optional keyword arguments
         @return: list of tweet data as dicts
         """
-        return self._run(Operation.TweetDetail, tweet_ids, **kwargs)
+        return await self._run(Operation.TweetDetail, tweet_ids, **kwargs)
 
-    def tweets(self, user_ids: list[int], **kwargs) -> list[dict]:
+    async def tweets(self, user_ids: list[int], **kwargs) -> list[dict]:
         """
         Get tweets by user ids.
 
         Metadata for users tweets.
+        Pass `incremental=True` to only get tweets newer than the previous complete crawl of each user.
 
         @param user_ids: list of user ids
         @param kwargs: optional keyword arguments
         @return: list of tweet data as dicts
         """
-        return self._run(Operation.UserTweets, user_ids, **kwargs)
+        return await self._run(Operation.UserTweets, user_ids, **kwargs)
 
-    def tweets_and_replies(self, user_ids: list[int], **kwargs) -> list[dict]:
+    async def tweets_and_replies(self, user_ids: list[int], **kwargs) -> list[dict]:
         """
         Get tweets and replies by user ids.
 
         Tweet metadata, including replies.
+        Pass `incremental=True` to only get tweets newer than the previous complete crawl of each user.
 
         @param user_ids: list of user ids
         @param kwargs: optional keyword arguments
         @return: list of tweet data as dicts
         """
-        return self._run(Operation.UserTweetsAndReplies, user_ids, **kwargs)
+        return await self._run(Operation.UserTweetsAndReplies, user_ids, **kwargs)
 
-    def media(self, user_ids: list[int], **kwargs) -> list[dict]:
+    async def media(self, user_ids: list[int], **kwargs) -> list[dict]:
         """
         Get media by user ids.
 
         Tweet metadata, filtered for tweets containing media.
+        Pass `incremental=True` to only get tweets newer than the previous complete crawl of each user.
 
         @param user_ids: list of user ids
         @param kwargs: optional keyword arguments
         @return: list of tweet data as dicts
         """
-        return self._run(Operation.UserMedia, user_ids, **kwargs)
+        return await self._run(Operation.UserMedia, user_ids, **kwargs)
 
-    def likes(self, user_ids: list[int], **kwargs) -> list[dict]:
+    async def likes(self, user_ids: list[int], **kwargs) -> list[dict]:
         """
         Get likes by user ids.
 
@@ -132,9 +227,9 @@ class Scraper:
         @param kwargs: optional keyword arguments
         @return: list of tweet data as dicts
         """
-        return self._run(Operation.Likes, user_ids, **kwargs)
+        return await self._run(Operation.Likes, user_ids, **kwargs)
 
-    def followers(self, user_ids: list[int], **kwargs) -> list[dict]:
+    async def followers(self, user_ids: list[int], **kwargs) -> list[dict]:
         """
         Get followers by user ids.
 
@@ -144,9 +239,9 @@ class Scraper:
         @param kwargs: optional keyword arguments
         @return: list of user data as dicts
         """
-        return self._run(Operation.Followers, user_ids, **kwargs)
+        return await self._run(Operation.Followers, user_ids, **kwargs)
 
-    def following(self, user_ids: list[int], **kwargs) -> list[dict]:
+    async def following(self, user_ids: list[int], **kwargs) -> list[dict]:
         """
         Get following by user ids.
 
@@ -156,9 +251,9 @@ class Scraper:
         @param kwargs: optional keyword arguments
         @return: list of user data as dicts
         """
-        return self._run(Operation.Following, user_ids, **kwargs)
+        return await self._run(Operation.Following, user_ids, **kwargs)
 
-    def favoriters(self, tweet_ids: list[int], **kwargs) -> list[dict]:
+    async def favoriters(self, tweet_ids: list[int], **kwargs) -> list[dict]:
         """
         Get favoriters by tweet ids.
 
@@ -168,9 +263,9 @@ class Scraper:
         @param kwargs: optional keyword arguments
         @return: list of user data as dicts
         """
-        return self._run(Operation.Favoriters, tweet_ids, **kwargs)
+        return await self._run(Operation.Favoriters, tweet_ids, **kwargs)
 
-    def retweeters(self, tweet_ids: list[int], **kwargs) -> list[dict]:
+    async def retweeters(self, tweet_ids: list[int], **kwargs) -> list[dict]:
         """
         Get retweeters by tweet ids.
 
@@ -180,9 +275,9 @@ class Scraper:
         @param kwargs: optional keyword arguments
         @return: list of user data as dicts
         """
-        return self._run(Operation.Retweeters, tweet_ids, **kwargs)
+        return await self._run(Operation.Retweeters, tweet_ids, **kwargs)
 
-    def tweet_stats(self, user_ids: list[int], **kwargs) -> list[dict]:
+    async def tweet_stats(self, user_ids: list[int], **kwargs) -> list[dict]:
         """
         Get tweet statistics by user ids.
 
@@ -190,9 +285,9 @@ class Scraper:
         @param kwargs: optional keyword arguments
         @return: list of tweet statistics as dicts
         """
-        return self._run(Operation.TweetStats, user_ids, **kwargs)
+        return await self._run(Operation.TweetStats, user_ids, **kwargs)
 
-    def users_by_ids(self, user_ids: list[int], **kwargs) -> list[dict]:
+    async def users_by_ids(self, user_ids: list[int], **kwargs) -> list[dict]:
         """
         Get user data by user ids.
 
@@ -202,9 +297,9 @@ class Scraper:
         @param kwargs: optional keyword arguments
         @return: list of user data as dicts
         """
-        return self._run(Operation.UsersByRestIds, batch_ids(user_ids), **kwargs)
+        return await self._run(Operation.UsersByRestIds, self.batcher.batches(Operation.UsersByRestIds, user_ids), **kwargs)
 
-    def recommended_users(self, user_ids: list[int] = None, **kwargs) -> list[dict]:
+    async def recommended_users(self, user_ids: list[int] = None, **kwargs) -> list[dict]:
         """
         Get recommended users by user ids, or general recommendations if no user ids are provided.
 
@@ -216,9 +311,9 @@ class Scraper:
             contexts = [{"context": orjson.dumps({"contextualUserId": x}).decode()} for x in user_ids]
         else:
             contexts = [{'context': None}]
-        return self._run(Operation.ConnectTabTimeline, contexts, **kwargs)
+        return await self._run(Operation.ConnectTabTimeline, contexts, **kwargs)
 
-    def profile_spotlights(self, screen_names: list[str], **kwargs) -> list[dict]:
+    async def profile_spotlights(self, screen_names: list[str], **kwargs) -> list[dict]:
         """
         Get user data by screen names.
 
@@ -229,23 +324,176 @@ class Scraper:
         @param kwargs: optional keyword arguments
         @return: list of user data as dicts
         """
-        return self._run(Operation.ProfileSpotlightsQuery, screen_names, **kwargs)
+        return await self._run(Operation.ProfileSpotlightsQuery, screen_names, **kwargs)
 
-    def users_by_id(self, user_ids: list[int], **kwargs) -> list[dict]:
+    async def user_ids(self, screen_names: list[str], **kwargs) -> dict[str, int]:
         """
-        Get user data by user ids.
+        Resolve screen names to user ids.
 
-        This endpoint is included for completeness only.
-        Use the batched query `users_by_ids` instead if you wish to pull user profile data.
+        Names already in the user index are resolved locally, only unknown or stale names are requested.
+
+        @param screen_names: list of screen names (usernames), any case
+        @param kwargs: optional keyword arguments
+        @return: dict of screen name (as given) -> user id, names that could not be resolved are omitted
+        """
+        known = self.user_index.user_ids(screen_names) if self.user_index is not None else {}
+        if unknown := [s for s in dict.fromkeys(screen_names) if s not in known]:
+            found = {k.lower(): v for k, v in find_users(await self.users(unknown, **(kwargs | {'models': False}))).items()}
+            known |= {s: found[s.lower()] for s in unknown if s.lower() in found}
+        return known
+
+    async def users_by_id(self, user_ids: list[int], **kwargs) -> list[dict]:
+        """
+        Get user data by user ids.
 
+        Lookups are coalesced into `UsersByRestIds` batches, together with any concurrent `load_user` calls.
+        Pass `batch=False` (or extra query variables) to send one `UserByRestId` request per id instead.
 
         @param user_ids: list of user ids
         @param kwargs: optional keyword arguments
         @return: list of user data as dicts
         """
-        return self._run(Operation.UserByRestId, user_ids, **kwargs)
+        if kwargs.pop('batch', True) and kwargs.keys() <= {'models'}:
+            return await self._load_all(self.load_user, user_ids, **kwargs)
+        return await self._run(Operation.UserByRestId, user_ids, **kwargs)
+
+    async def load_tweet(self, tweet_id: int | str) -> dict | None:
+        """
+        Get a single tweet, batched with every other lookup made within `batch_window` seconds.
+
+        Safe to call from many coroutines at once, e.g. `await asyncio.gather(*(scraper.load_tweet(i) for i in ids))`.
+
+        @param tweet_id: tweet id
+        @return: tweet data shaped like a `TweetResultByRestId` response, None if not returned
+        """
+        if item := await self.loaders['tweets'].load(tweet_id):
+            return {'data': {'tweetResult': item}}
+
+    async def load_user(self, user_id: int | str) -> dict | None:
+        """
+        Get a single user, batched with every other lookup made within `batch_window` seconds.
+
+        @param user_id: user id
+        @return: user data shaped like a `UserByRestId` response, None if not returned
+        """
+        if item := await self.loaders['users'].load(user_id):
+            return {'data': {'user': item}}
+
+    async def _load_all(self, load: callable, ids: list[int | str], models: bool = None) -> list:
+        res = []
+        for r in await asyncio.gather(*(load(i) for i in ids), return_exceptions=True):
+            if isinstance(r, Exception):
+                if self.debug:
+                    self.logger.error(f'Batched lookup failed\n{r}')
+            elif r:
+                res.append(r)
+        models = self.models if models is None else models
+        return parse_models(res, models == 'raw') if models else res
+
+    async def _fetch_batch(self, operation: tuple, field: str, ids: list[str]) -> dict[str, dict]:
+        """ Fetch one batch for a `BatchLoader`, results are keyed by rest_id, raises if the request failed """
+        keys, qid, name = operation
+        member = self.pool.checkout(name)
+        try:
+            r = await self._query(member, operation, **{next(iter(keys)): ids})
+        finally:
+            self.pool.checkin(member)
+        data = r.json() if r.status_code == 200 else {}
+        if not data.get('data'):
+            # a 429/5xx left after retries must not look like ids that were not found
+            errors = '; '.join(e.get('message', '') for e in data.get('errors') or [])
+            raise Exception(f'{name} batch of {len(ids)} ids failed with {r.status_code}{f": {errors}" if errors else ""}')
+        if self.user_index is not None:
+            await self._index_users(self.paths.extract(name, data))
+        res = {}
+        for item in data['data'].get(field) or []:
+            result = (item or {}).get('result') or {}
+            # tweets with visibility results nest the tweet one level down
+            if rest_id := result.get('rest_id') or (result.get('tweet') or {}).get('rest_id'):
+                res[rest_id] = item
+        return res
+
+    def iter_tweets(self, user_ids: Iterable | AsyncIterable, **kwargs) -> AsyncGenerator:
+        """
+        Stream tweets by user ids, one page at a time.
+
+        @param user_ids: user ids, may be an iterator or async iterator
+        @param kwargs: optional keyword arguments
+        @return: async generator of (query, page, next cursor)
+        """
+        return self._iter(Operation.UserTweets, user_ids, **kwargs)
+
+    def iter_tweets_and_replies(self, user_ids: Iterable | AsyncIterable, **kwargs) -> AsyncGenerator:
+        """
+        Stream tweets and replies by user ids, one page at a time.
+
+        @param user_ids: user ids, may be an iterator or async iterator
+        @param kwargs: optional keyword arguments
+        @return: async generator of (query, page, next cursor)
+        """
+        return self._iter(Operation.UserTweetsAndReplies, user_ids, **kwargs)
 
-    def download_media(self, ids: list[int], photos: bool = True, videos: bool = True, cards: bool = True, hq_img_variant: bool = True, video_thumb: bool = False, out: str = 'media',
+    def iter_media(self, user_ids: Iterable | AsyncIterable, **kwargs) -> AsyncGenerator:
+        """
+        Stream media by user ids, one page at a time.
+
+        @param user_ids: user ids, may be an iterator or async iterator
+        @param kwargs: optional keyword arguments
+        @return: async generator of (query, page, next cursor)
+        """
+        return self._iter(Operation.UserMedia, user_ids, **kwargs)
+
+    def iter_likes(self, user_ids: Iterable | AsyncIterable, **kwargs) -> AsyncGenerator:
+        """
+        Stream likes by user ids, one page at a time.
+
+        @param user_ids: user ids, may be an iterator or async iterator
+        @param kwargs: optional keyword arguments
+        @return: async generator of (query, page, next cursor)
+        """
+        return self._iter(Operation.Likes, user_ids, **kwargs)
+
+    def iter_followers(self, user_ids: Iterable | AsyncIterable, **kwargs) -> AsyncGenerator:
+        """
+        Stream followers by user ids, one page at a time.
+
+        @param user_ids: user ids, may be an iterator or async iterator
+        @param kwargs: optional keyword arguments
+        @return: async generator of (query, page, next cursor)
+        """
+        return self._iter(Operation.Followers, user_ids, **kwargs)
+
+    def iter_following(self, user_ids: Iterable | AsyncIterable, **kwargs) -> AsyncGenerator:
+        """
+        Stream following by user ids, one page at a time.
+
+        @param user_ids: user ids, may be an iterator or async iterator
+        @param kwargs: optional keyword arguments
+        @return: async generator of (query, page, next cursor)
+        """
+        return self._iter(Operation.Following, user_ids, **kwargs)
+
+    def iter_favoriters(self, tweet_ids: Iterable | AsyncIterable, **kwargs) -> AsyncGenerator:
+        """
+        Stream favoriters by tweet ids, one page at a time.
+
+        @param tweet_ids: tweet ids, may be an iterator or async iterator
+        @param kwargs: optional keyword arguments
+        @return: async generator of (query, page, next cursor)
+        """
+        return self._iter(Operation.Favoriters, tweet_ids, **kwargs)
+
+    def iter_retweeters(self, tweet_ids: Iterable | AsyncIterable, **kwargs) -> AsyncGenerator:
+        """
+        Stream retweeters by tweet ids, one page at a time.
+
+        @param tweet_ids: tweet ids, may be an iterator or async iterator
+        @param kwargs: optional keyword arguments
+        @return: async generator of (query, page, next cursor)
+        """
+        return self._iter(Operation.Retweeters, tweet_ids, **kwargs)
+
+    async def download_media(self, ids: list[int], photos: bool = True, videos: bool = True, cards: bool = True, hq_img_variant: bool = True, video_thumb: bool = False, out: str = 'media',
                        metadata_out: str = 'media.json', **kwargs) -> dict:
         """
         Download and extract media metadata from Tweets
@@ -261,33 +509,29 @@ class Scraper:
         @return: media data
         """
 
+        # connection limits are owned by the shared client manager
+        for k in ('max_connections', 'max_keepalive_connections', 'keepalive_expiry'):
+            kwargs.pop(k, None)
+        chunk_size = kwargs.pop('chunk_size', None)
+
         async def process(fns: Generator) -> list:
-            limits = {
-                'max_connections': kwargs.pop('max_connections', 1000),
-                'max_keepalive_connections': kwargs.pop('max_keepalive_connections', None),
-                'keepalive_expiry': kwargs.pop('keepalive_expiry', 5.0),
-            }
-            headers = {'user-agent': random.choice(USER_AGENTS)}
-            async with AsyncClient(limits=Limits(**limits), headers=headers, http2=True, verify=False, timeout=60, follow_redirects=True) as client:
-                return await tqdm_asyncio.gather(*(fn(client=client) for fn in fns), desc='Downloading Media')
+            return await tqdm_asyncio.gather(*(fn() for fn in fns), desc='Downloading Media')
 
         def download(urls: list[tuple], out: str) -> Generator:
             out = Path(out)
-            out.mkdir(parents=True, exist_ok=True)
-            chunk_size = kwargs.pop('chunk_size', None)
 
-            async def get(client: AsyncClient, url: str):
+            async def get(url: str):
                 tid, cdn_url = url
                 ext = urlsplit(cdn_url).path.split('/')[-1]
                 fname = out / f'{tid}_{ext}'
-                async with aiofiles.open(fname, 'wb') as fp:
-                    async with client.stream('GET', cdn_url) as r:
-                        async for chunk in r.aiter_raw(chunk_size):
-                            await fp.write(chunk)
+                await self.writer.write(fname, b'')
+                async with self.clients.get(cdn_url).stream('GET', cdn_url) as r:
+                    async for chunk in r.aiter_raw(chunk_size):
+                        await self.writer.append(fname, chunk)
 
             return (partial(get, url=u) for u in urls)
 
-        tweets = self.tweets_by_ids(ids, **kwargs)
+        tweets = await self.tweets_by_ids(ids, **(kwargs | {'models': False}))
         media = {}
         for data in tweets:
             for tweet in data.get('data', {}).get('tweetResult', []):
@@ -316,9 +560,7 @@ class Scraper:
                             media[_id]['card'].extend(card.get('binding_values', []))
         if metadata_out:
             media = set2list(media)
-            metadata_out = Path(metadata_out)
-            metadata_out.parent.mkdir(parents=True, exist_ok=True)  # if user specifies subdir
-            metadata_out.write_bytes(orjson.dumps(media))
+            await self.writer.write(metadata_out, orjson.dumps(media))
 
         res = []
         for k, v in media.items():
@@ -332,10 +574,11 @@ class Scraper:
             if cards:
                 tmp.extend(parse_card_media(v['card']))
             res.extend([(k, m) for m in tmp])
-        asyncio.run(process(download(res, out)))
+        await process(download(res, out))
+        await self.writer.flush()
         return media
 
-    def trends(self, utc: list[str] = None) -> dict:
+    async def trends(self, utc: list[str] = None) -> dict:
         """
         Get trends for all UTC offsets
 
@@ -345,8 +588,8 @@ class Scraper:
 
         async def get_trends(client: AsyncClient, offset: str, url: str):
             try:
-                client.headers['x-twitter-utcoffset'] = offset
-                r = await client.get(url)
+                # per-request header, the client is shared by all offsets
+                r = await client.get(url, headers={'x-twitter-utcoffset': offset})
                 trends = find_key(r.json(), 'item')
                 return {t['content']['trend']['name']: t for t in trends}
             except Exception as e:
@@ -358,21 +601,20 @@ class Scraper:
             offsets = utc or ["-1200", "-1100", "-1000", "-0900", "-0800", "-0700", "-0600", "-0500", "-0400", "-0300",
                               "-0200", "-0100", "+0000", "+0100", "+0200", "+0300", "+0400", "+0500", "+0600", "+0700",
                               "+0800", "+0900", "+1000", "+1100", "+1200", "+1300", "+1400"]
-            async with AsyncClient(headers=get_headers(self.session)) as client:
-                tasks = (get_trends(client, o, url) for o in offsets)
-                if self.pbar:
-                    return await tqdm_asyncio.gather(*tasks, desc='Getting trends')
-                return await asyncio.gather(*tasks)
-
-        trends = asyncio.run(process())
-        out = self.out / 'raw' / 'trends'
-        out.mkdir(parents=True, exist_ok=True)
-        (out / f'{time.time_ns()}.json').write_text(orjson.dumps(
+            client = self.clients.get(url)
+            tasks = (get_trends(client, o, url) for o in offsets)
+            if self.pbar:
+                return await tqdm_asyncio.gather(*tasks, desc='Getting trends')
+            return await asyncio.gather(*tasks)
+
+        trends = await process()
+        await self.writer.write(self.out / 'raw' / 'trends' / f'{time.time_ns()}.json', orjson.dumps(
             {k: v for d in trends for k, v in d.items()},
-            option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS).decode(), encoding='utf-8')
+            option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS))
+        await self.writer.flush()
         return trends
 
-    def spaces(self, *, rooms: list[str] = None, search: list[dict] = None, audio: bool = False, chat: bool = False,
+    async def spaces(self, *, rooms: list[str] = None, search: list[dict] = None, audio: bool = False, chat: bool = False,
                **kwargs) -> list[dict]:
         """
         Get Twitter spaces data
@@ -388,17 +630,17 @@ class Scraper:
         @return: list of spaces data
         """
         if rooms:
-            spaces = self._run(Operation.AudioSpaceById, rooms, **kwargs)
+            spaces = await self._run(Operation.AudioSpaceById, rooms, **(kwargs | {'models': False}))
         else:
-            res = self._run(Operation.AudioSpaceSearch, search, **kwargs)
+            res = await self._run(Operation.AudioSpaceSearch, search, **(kwargs | {'models': False}))
             search_results = set(find_key(res, 'rest_id'))
-            spaces = self._run(Operation.AudioSpaceById, search_results, **kwargs)
+            spaces = await self._run(Operation.AudioSpaceById, search_results, **(kwargs | {'models': False}))
         if audio or chat:
-            return self._get_space_data(spaces, audio, chat)
+            return await self._get_space_data(spaces, audio, chat)
         return spaces
 
-    def _get_space_data(self, spaces: list[dict], audio=True, chat=True):
-        streams = self._check_streams(spaces)
+    async def _get_space_data(self, spaces: list[dict], audio=True, chat=True):
+        streams = await self._check_streams(spaces)
         chat_data = None
         if chat:
             temp = []  # get necessary keys instead of passing large dicts
@@ -411,17 +653,17 @@ class Scraper:
                         'media_key': meta['media_key'],
                         'state': meta['state'],
                     })
-            chat_data = self._get_chat_data(temp)
+            chat_data = await self._get_chat_data(temp)
         if audio:
             temp = []
             for stream in streams:
                 if stream.get('stream'):
-                    chunks = self._get_chunks(stream['stream']['source']['location'])
+                    chunks = await self._get_chunks(stream['stream']['source']['location'])
                     temp.append({
                         'rest_id': stream['space']['data']['audioSpace']['metadata']['rest_id'],
                         'chunks': chunks,
                     })
-            self._download_audio(temp)
+            await self._download_audio(temp)
         return chat_data
 
     async def _get_stream(self, client: AsyncClient, media_key: str) -> dict | None:
@@ -482,11 +724,11 @@ class Scraper:
             parsed.extend(messages)
         return parsed
 
-    def _get_chunks(self, location: str) -> list[str]:
+    async def _get_chunks(self, location: str) -> list[str]:
         try:
             url = URL(location)
             stream_type = url.params.get('type')
-            r = self.session.get(
+            r = await self.clients.get(location).get(
                 url=location,
                 params={'type': stream_type},
                 headers={'authority': url.host}
@@ -499,12 +741,12 @@ class Scraper:
             if self.debug:
                 self.logger.error(f'Failed to get chunks\n{e}')
 
-    def _get_chat_data(self, keys: list[dict]) -> list[dict]:
+    async def _get_chat_data(self, keys: list[dict]) -> list[dict]:
         async def get(c: AsyncClient, key: dict) -> dict:
             info = await self._init_chat(c, key['chat_token'])
             chat = await self._get_chat(c, info['endpoint'], info['access_token'])
             if self.save:
-                (self.out / 'raw' / f"chat_{key['rest_id']}.json").write_bytes(orjson.dumps(chat))
+                await self.writer.write(self.out / 'raw' / f"chat_{key['rest_id']}.json", orjson.dumps(chat))
             return {
                 'space': key['rest_id'],
                 'chat': chat,
@@ -512,215 +754,488 @@ class Scraper:
             }
 
         async def process():
-            (self.out / 'raw').mkdir(parents=True, exist_ok=True)
-            limits = Limits(max_connections=100, max_keepalive_connections=10)
-            headers = self.session.headers if self.guest else get_headers(self.session)
-            cookies = self.session.cookies
-            async with AsyncClient(limits=limits, headers=headers, cookies=cookies, timeout=20) as c:
-                tasks = (get(c, key) for key in keys)
-                if self.pbar:
-                    return await tqdm_asyncio.gather(*tasks, desc='Downloading chat data')
-                return await asyncio.gather(*tasks)
-
-        return asyncio.run(process())
-
-    def _download_audio(self, data: list[dict]) -> None:
+            c = self.clients.get('proxsee.pscp.tv')
+            tasks = (get(c, key) for key in keys)
+            if self.pbar:
+                return await tqdm_asyncio.gather(*tasks, desc='Downloading chat data')
+            return await asyncio.gather(*tasks)
+
+        return await process()
+
+    async def _download_audio(self, data: list[dict]) -> None:
         async def get(s: AsyncClient, chunk: str, rest_id: str) -> tuple:
             r = await s.get(chunk)
             return rest_id, r
 
         async def process(data: list[dict]) -> list:
-            limits = Limits(max_connections=100, max_keepalive_connections=10)
-            headers = self.session.headers if self.guest else get_headers(self.session)
-            cookies = self.session.cookies
-            async with AsyncClient(limits=limits, headers=headers, cookies=cookies, timeout=20) as c:
-                tasks = []
-                for d in data:
-                    tasks.extend([get(c, chunk, d['rest_id']) for chunk in d['chunks']])
-                if self.pbar:
-                    return await tqdm_asyncio.gather(*tasks, desc='Downloading audio')
-                return await asyncio.gather(*tasks)
-
-        chunks = asyncio.run(process(data))
+            tasks = []
+            for d in data:
+                tasks.extend([get(self.clients.get(chunk), chunk, d['rest_id']) for chunk in d['chunks']])
+            if self.pbar:
+                return await tqdm_asyncio.gather(*tasks, desc='Downloading audio')
+            return await asyncio.gather(*tasks)
+
+        chunks = await process(data)
         streams = {}
         [streams.setdefault(_id, []).append(chunk) for _id, chunk in chunks]
         # ensure chunks are in correct order
         for k, v in streams.items():
             streams[k] = sorted(v, key=lambda x: int(re.findall('_(\d+)_\w\.aac$', x.url.path)[0]))
-        out = self.out / 'audio'
-        out.mkdir(parents=True, exist_ok=True)
         for space_id, chunks in streams.items():
             # 1hr ~= 50mb
-            with open(out / f'{space_id}.aac', 'wb') as fp:
-                [fp.write(c.content) for c in chunks]
+            await self.writer.write(self.out / 'audio' / f'{space_id}.aac', b''.join(c.content for c in chunks))
+        await self.writer.flush()
 
-    def _check_streams(self, keys: list[dict]) -> list[dict]:
+    async def _check_streams(self, keys: list[dict]) -> list[dict]:
         async def get(c: AsyncClient, space: dict) -> dict:
             media_key = space['data']['audioSpace']['metadata']['media_key']
             stream = await self._get_stream(c, media_key)
             return {'space': space, 'stream': stream}
 
         async def process():
-            limits = Limits(max_connections=100, max_keepalive_connections=10)
-            headers = self.session.headers if self.guest else get_headers(self.session)
-            cookies = self.session.cookies
-            async with AsyncClient(limits=limits, headers=headers, cookies=cookies, timeout=20) as c:
-                return await asyncio.gather(*(get(c, key) for key in keys))
+            c = self.clients.get('twitter.com')
+            return await asyncio.gather(*(get(c, key) for key in keys))
 
-        return asyncio.run(process())
+        return await process()
 
-    def _run(self, operation: tuple[dict, str, str], queries: set | list[int | str | list | dict], **kwargs):
+    async def _run(self, operation: tuple[dict, str, str], queries: set | list[int | str | list | dict], **kwargs):
         keys, qid, name = operation
-        # stay within rate-limits
-        if (l := len(queries)) > MAX_ENDPOINT_LIMIT:
-            if self.debug:
-                self.logger.warning(f'Got {l} queries, truncating to first 500.')
-            queries = list(queries)[:MAX_ENDPOINT_LIMIT]
+        models = kwargs.pop('models', self.models)
+        # no truncation needed, `_query` waits for rate-limit budget before each request
+        # the first query decides the kind, (async) iterators are read lazily and must not lose it
+        first, queries = await _peek(queries)
+        if first is None or isinstance(first, dict):
+            data = await self._process(operation, queries, **kwargs)
+            data = get_json(data, **kwargs)
+            return parse_models(data, models == 'raw') if models else data
+
+        # queries are of type set | list[int|str], need to convert to dicts
+        if isinstance(queries, AsyncIterable):
+            async def convert():
+                async for q in queries:
+                    for k in keys:
+                        yield {k: q}
+
+            _queries = convert()
+        else:
+            _queries = ({k: q} for q in queries for k in keys)
+        res = await self._process(operation, _queries, **kwargs)
+        data = get_json(res, **kwargs)
+        if kwargs.get('cursor'):
+            data = data.pop()
+            return [parse_models(data[0], models == 'raw'), data[1]] if models else data
+        data = flatten(data)
+        return parse_models(data, models == 'raw') if models else data
 
-        if all(isinstance(q, dict) for q in queries):
-            data = asyncio.run(self._process(operation, list(queries), **kwargs))
-            return get_json(data, **kwargs)
+    async def _iter(self, operation: tuple[dict, str, str], queries: Iterable | AsyncIterable, **kwargs) -> AsyncGenerator:
+        """
+        Streaming counterpart of `_run`
 
-        # queries are of type set | list[int|str], need to convert to list[dict]
-        _queries = [{k: q} for q in queries for k, v in keys.items()]
-        res = asyncio.run(self._process(operation, _queries, **kwargs))
-        data = get_json(res, **kwargs)
-        return data.pop() if kwargs.get('cursor') else flatten(data)
+        Pages are yielded as soon as they are fetched. Concurrent chains block once the consumer falls
+        behind, and breaking out of the loop stops every chain.
+        """
+        keys, qid, name = operation
+        key = next(iter(keys))
+        if isinstance(queries, AsyncIterable):
+            async def convert():
+                async for q in queries:
+                    yield q if isinstance(q, dict) else {key: q}
+
+            _queries = convert()
+        elif isinstance(queries, Sized):
+            _queries = [q if isinstance(q, dict) else {key: q} for q in queries]
+        else:
+            _queries = (q if isinstance(q, dict) else {key: q} for q in queries)
+        models = kwargs.pop('models', self.models)
+        async with aclosing(self._iter_process(operation, _queries, stream=True, **kwargs)) as pages:
+            async for query, data, cursor in pages:
+                yield query, parse_models(data, models == 'raw') if models else data, cursor
 
-    async def _query(self, client: AsyncClient, operation: tuple, **kwargs) -> Response:
+    async def _query(self, member: PooledSession, operation: tuple, **kwargs) -> JSONResponse:
         keys, qid, name = operation
-        params = {
-            'variables': Operation.default_variables | keys | kwargs,
-            'features': Operation.default_features,
-        }
-        r = await client.get(f'https://twitter.com/i/api/graphql/{qid}/{name}', params=build_params(params))
+        # per-call flags: `cache=False` bypasses the cache, `refresh=True` skips lookup but stores the new response
+        use_cache = kwargs.pop('cache', True) and self.cache is not None and self.cache.enabled(name)
+        refresh = kwargs.pop('refresh', False)
+        # `seen=False` keeps items already fetched by earlier runs
+        use_seen = kwargs.pop('seen', True) and self.seen is not None
+        hit = await self.cache.get(name, kwargs) if use_cache and not refresh else None
+        if hit is not None:
+            # a hit goes through the same saving, seen filtering and indexing as a fetched response
+            if self.debug:
+                self.logger.debug(f'{name} cache hit {kwargs}')
+            r = hit
+        else:
+            client = self.clients.get('twitter.com', member.session)
+            url = request_template(operation).url(kwargs)
+            headers = None
+            await member.limiter.acquire(name)
+            try:
+                r = await client.get(url)
+                r = JSONResponse.from_response(r)
+                headers = r.headers
+            finally:
+                await member.limiter.release(name, headers)
 
-        try:
-            self.rate_limits[name] = {k: int(v) for k, v in r.headers.items() if 'rate-limit' in k}
-        except Exception as e:
-            self.logger.debug(f'{e}')
+            try:
+                member.rate_limits[name] = {k: int(v) for k, v in r.headers.items() if 'rate-limit' in k}
+                self.rate_limits[name] = member.rate_limits[name]
+            except Exception as e:
+                self.logger.debug(f'{e}')
 
-        if self.debug:
-            log(self.logger, self.debug, r)
+            if (key := id_key(operation)) and r.url is not None:
+                size = len(r.url.raw_path)
+                if r.status_code in TOO_LARGE and len(kwargs.get(key) or ()) > 1:
+                    # split the batch and retry, the halves are saved and cached on their own
+                    self.batcher.rejected(operation, size)
+                    if self.debug:
+                        self.logger.debug(f'{name} request of {size} bytes rejected ({r.status_code}), splitting {len(kwargs[key])} ids')
+                    ids = kwargs[key]
+                    halves = (ids[:len(ids) // 2], ids[len(ids) // 2:])
+                    return merge_responses(await asyncio.gather(*(self._query(member, operation, **(kwargs | {key: h})) for h in halves)))
+                if r.status_code == 200:
+                    self.batcher.succeeded(name, size)
+
+            if self.debug:
+                log(self.logger, self.debug, r)
+        fresh, new = r, None
+        if use_seen and r.status_code == 200:
+            r, new = await self._drop_seen(r)
         if self.save:
-            await save_json(r, self.out, name, **kwargs)
+            if self.archive:
+                variables = {k: v for k, v in kwargs.items() if k != 'cursor'}
+                await self.writer.call(self.archive.append, name, r.content, variables, kwargs.get('cursor'))
+            else:
+                await save_json(r, self.out, name, self.writer, **kwargs)
+        if use_cache and hit is None:
+            await self.cache.set(name, kwargs, fresh)
+        if new:
+            await self.writer.call(self.seen.add, new)
         return r
 
-    async def _process(self, operation: tuple, queries: list[dict], **kwargs):
-        headers = self.session.headers if self.guest else get_headers(self.session)
-        cookies = self.session.cookies
-        async with AsyncClient(limits=Limits(max_connections=MAX_ENDPOINT_LIMIT), headers=headers, cookies=cookies, timeout=20) as c:
-            tasks = (self._paginate(c, operation, **q, **kwargs) for q in queries)
-            if self.pbar:
-                return await tqdm_asyncio.gather(*tasks, desc=operation[-1])
-            return await asyncio.gather(*tasks)
+    async def _drop_seen(self, r: JSONResponse) -> tuple[JSONResponse, list]:
+        """ Remove timeline entries of already seen tweets/users, return the filtered response and the new items """
+        try:
+            data = r.json()
+        except Exception:
+            return r, []
+        if not (items := timeline_items(data)):
+            return r, []
+        known = await asyncio.to_thread(self.seen.known, items)
+        if known:
+            n = drop_entries(data, lambda kind, i: (kind, i) in known)
+            if self.debug:
+                self.logger.debug(f'Dropped {n} already seen entries')
+            filtered = JSONResponse(orjson.dumps(data), r.status_code, r.headers, r.url)
+            filtered._data = data
+            r = filtered
+        return r, [x for x in dict.fromkeys(items) if x not in known]
+
+    async def _index_users(self, page: PageExtract) -> None:
+        # users are collected by the page extraction every response goes through anyway, no walk of its own
+        if self.user_index is not None and page.users:
+            await self.writer.call(self.user_index.add, page.users)
+
+    async def _process(self, operation: tuple, queries: Iterable[dict] | AsyncIterable[dict], **kwargs) -> list:
+        res = [(i, r) async for i, r in self._iter_process(operation, queries, **kwargs)]
+        await self.writer.flush()
+        return [r for _, r in sorted(res, key=lambda x: x[0])]
+
+    async def _iter_process(self, operation: tuple, queries: Iterable[dict] | AsyncIterable[dict], stream: bool = False,
+                            **kwargs) -> AsyncGenerator:
+        """
+        Run `_paginate` over queries with a fixed-size worker pool
+
+        Queries are pulled lazily from a (async) iterator and results are yielded as soon as each query completes,
+        so memory stays flat no matter how many queries there are.
+
+        @param operation: GraphQL operation
+        @param queries: iterator or async iterator of query variables
+        @param stream: yield individual pages as they arrive instead of whole cursor chains
+        @param kwargs: optional keyword arguments, `concurrency` overrides the number of workers,
+            `prefetch` the number of pages a stream may fetch ahead of its consumer
+        @return: async generator of (query index, result) in completion order,
+            or (query, page, next cursor) if streaming
+        """
+        name = operation[-1]
+        n = kwargs.pop('concurrency', None) or self._concurrency(name)
+        # a slot per streamed page, taken before it is fetched and given back once the consumer is done with it,
+        # so a stalled consumer holds at most `prefetch` pages no matter how many chains run concurrently
+        slots = asyncio.Semaphore(kwargs.pop('prefetch', STREAM_PREFETCH))
+        total = len(queries) if isinstance(queries, Sized) else None
+        if isinstance(queries, AsyncIterable):
+            it, is_async = aiter(queries), True
+        else:
+            it, is_async = iter(enumerate(queries)), False
+        lock = asyncio.Lock()
+        results = asyncio.Queue()  # streamed pages are bounded by `slots`, whole chains by the number of workers
+        done = object()
+        errors = []
+        idx = 0
+
+        async def next_query():
+            nonlocal idx
+            async with lock:
+                try:
+                    if is_async:
+                        q = await anext(it)
+                        idx += 1
+                        return idx - 1, q
+                    return next(it)
+                except (StopIteration, StopAsyncIteration):
+                    return done
+
+        async def worker():
+            while (q := await next_query()) is not done:
+                i, q = q
+                if stream:
+                    await slots.acquire()
+                    try:
+                        async with aclosing(self._iter_paginate(operation, **q, **kwargs)) as pages:
+                            async for r, cursor in pages:
+                                await results.put((q, r.json(), cursor))  # the slot goes with the page
+                                await slots.acquire()  # for the next one
+                    except Exception:
+                        ...  # already logged, only this chain is dropped
+                    finally:
+                        slots.release()
+                else:
+                    await results.put((i, await self._paginate(operation, **q, **kwargs)))
+                pbar.update()
+
+        async def supervise():
+            try:
+                await asyncio.gather(*workers)
+            except Exception as e:
+                errors.append(e)
+            await results.put(done)
+
+        pbar = tqdm_asyncio(total=total, desc=name, disable=not self.pbar)
+        workers = [asyncio.create_task(worker()) for _ in range(n if total is None else min(n, total))]
+        supervisor = asyncio.create_task(supervise())
+        try:
+            while (r := await results.get()) is not done:
+                yield r
+                if stream:
+                    slots.release()
+            if errors:
+                raise errors[0]
+        finally:
+            pbar.close()
+            tasks = workers + [supervisor]
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _concurrency(self, name: str) -> int:
+        if isinstance(self.concurrency, dict):
+            return self.concurrency.get(name, MAX_ENDPOINT_LIMIT)
+        return self.concurrency
+
+    async def _paginate(self, operation: tuple, **kwargs):
+        is_resuming = bool(kwargs.get('cursor'))
+        res, cursor = [], kwargs.get('cursor')
+        try:
+            async with aclosing(self._iter_paginate(operation, **kwargs)) as pages:
+                async for r, cursor in pages:
+                    res.append(r)
+        except Exception:
+            return
+        if is_resuming:
+            return res, cursor
+        return res
 
-    async def _paginate(self, client: AsyncClient, operation: tuple, **kwargs):
+    async def _iter_paginate(self, operation: tuple, **kwargs) -> AsyncGenerator:
+        """
+        Follow the cursor chain of a single query, yielding each page as soon as it is fetched
+
+        With `resume=<job id>`, progress is checkpointed to the journal after every page. Finished queries are skipped
+        and unfinished ones continue from their last cursor, only pages fetched in this run are yielded. An error page
+        (not a 200, or GraphQL `errors`) is yielded with the last good cursor and ends the chain without a checkpoint,
+        so a resumed job fetches it again.
+
+        With `incremental=True` (user timelines only), tweets at or below the newest tweet id of the last complete crawl
+        are removed from the pages, and pagination stops at the first page with no newer tweets. The mark only moves
+        when the chain ends on a good page.
+
+        @param operation: GraphQL operation
+        @param kwargs: query variables, plus optional `limit`, `cursor`, `resume` and `incremental`
+        @return: async generator of (response, next cursor)
+        """
+        name = operation[-1]
         limit = kwargs.pop('limit', math.inf)
         cursor = kwargs.pop('cursor', None)
-        is_resuming = False
+        job = kwargs.pop('resume', None) if self.journal else None
+        incremental = kwargs.pop('incremental', False) and self.journal is not None and name in INCREMENTAL_OPERATIONS
+        mark = await asyncio.to_thread(self.journal.mark, name, kwargs) if incremental else 0
+        newest, reached = mark, False
         dups = 0
         DUP_LIMIT = 3
-        if cursor:
-            is_resuming = True
-            res = []
-            ids = set()
-        else:
-            try:
-                r = await self._query(client, operation, **kwargs)
-                initial_data = r.json()
-                res = [r]
-                ids = {x for x in find_key(initial_data, 'rest_id') if x[0].isnumeric()}
-
-                cursor = get_cursor(initial_data)
-            except Exception as e:
+        ids = set()
+        failed = False
+        pages = seen = 0  # pages and results fetched by earlier runs of this job
+        if job and (cp := await asyncio.to_thread(self.journal.get, job, name, kwargs)):
+            if cp.done:
                 if self.debug:
-                    self.logger.error(f'Failed to get initial pagination data: {e}')
+                    self.logger.debug(f'{name} {kwargs} already done in job {job}')
                 return
-        while (dups < DUP_LIMIT) and cursor:
-            prev_len = len(ids)
-            if prev_len >= limit:
-                break
-            try:
-                r = await self._query(client, operation, cursor=cursor, **kwargs)
-                data = r.json()
-            except Exception as e:
-                if self.debug:
-                    self.logger.error(f'Failed to get pagination data\n{e}')
-                return
-            cursor = get_cursor(data)
-            ids |= {x for x in find_key(data, 'rest_id') if x[0].isnumeric()}
+            cursor, pages, seen = cp.cursor, cp.pages, cp.results
+        # cursors are session-bound, keep the whole chain on one account
+        member = self.pool.checkout(name)
+        try:
+            if not cursor:
+                try:
+                    r = await self._query(member, operation, **kwargs)
+                    if not (failed := self._failed(r)):
+                        page = self.paths.extract(name, r.json())
+                        await self._index_users(page)
+                        ids = page.ids()
+                        cursor = page.cursor
+                        if incremental:
+                            newest, reached = self._high_water(r, page, mark, newest)
+                            cursor = None if reached else cursor
+                except Exception as e:
+                    if self.debug:
+                        self.logger.error(f'Failed to get initial pagination data: {e}')
+                    raise
+                if failed:
+                    if self.debug:
+                        self.logger.error(f'{name} {kwargs} failed with {r.status_code}, not checkpointed')
+                    yield r, cursor
+                    return
+                pages += 1
+                if job:
+                    await self.writer.call(self._checkpoint, job, name, kwargs, cursor, pages, seen + len(ids), not cursor)
+                yield r, cursor
+            while (dups < DUP_LIMIT) and cursor:
+                prev_len = len(ids)
+                if prev_len + seen >= limit:
+                    break
+                try:
+                    r = await self._query(member, operation, cursor=cursor, **kwargs)
+                    if not (failed := self._failed(r)):
+                        page = self.paths.extract(name, r.json())
+                        await self._index_users(page)
+                except Exception as e:
+                    if self.debug:
+                        self.logger.error(f'Failed to get pagination data\n{e}')
+                    raise
+                if failed:
+                    # the last good cursor stays the resume point
+                    if self.debug:
+                        self.logger.error(f'{name} {kwargs} failed with {r.status_code} at cursor {cursor}, not checkpointed')
+                    yield r, cursor
+                    break
+                cursor = page.cursor
+                ids |= page.ids()
+                if incremental:
+                    newest, reached = self._high_water(r, page, mark, newest)
+                    cursor = None if reached else cursor
 
-            if self.debug:
-                self.logger.debug(f'Unique results: {len(ids)}\tcursor: {cursor}')
-            if prev_len == len(ids):
-                dups += 1
-            res.append(r)
-        if is_resuming:
-            return res, cursor
-        return res
+                if self.debug:
+                    self.logger.debug(f'Unique results: {len(ids)}\tcursor: {cursor}')
+                if prev_len == len(ids):
+                    dups += 1
+                pages += 1
+                if job:
+                    # queued behind the page itself, so a checkpoint never points past saved data
+                    await self.writer.call(self._checkpoint, job, name, kwargs, cursor, pages, seen + len(ids), not cursor)
+                yield r, cursor
+            if job and cursor and not failed:
+                # stopped by `limit` or repeated pages
+                await self.writer.call(self._checkpoint, job, name, kwargs, cursor, pages, seen + len(ids), True)
+            # only move the mark once everything newer than it was fetched, a chain cut short by `limit` or ended by an
+            # error page would leave a gap that later runs never fill, since they stop at the mark
+            if incremental and not failed and newest > mark and (reached or not cursor or dups >= DUP_LIMIT):
+                await self.writer.call(self.journal.set_mark, name, kwargs, newest)
+        finally:
+            self.pool.checkin(member)
+
+    @staticmethod
+    def _failed(r: JSONResponse) -> bool:
+        """ Error page: not a 200, or a GraphQL `errors` list """
+        if r.status_code != 200:
+            return True
+        try:
+            return bool(r.json().get('errors'))
+        except Exception:
+            return True
+
+    def _checkpoint(self, job: str, *args) -> None:
+        """ Runs on the writer thread after the page's own writes, archived pages are flushed before the journal commits """
+        if self.archive:
+            self.archive.flush()
+        self.journal.update(job, *args)
+
+    @staticmethod
+    def _high_water(r: JSONResponse, page: PageExtract, mark: int, newest: int) -> tuple[int, bool]:
+        """ Drop tweets at or below the mark from a page, return the newest tweet id so far and whether the mark was reached """
+        tweet_ids = page.timeline_tweet_ids()
+        newest = max(newest, *tweet_ids) if tweet_ids else newest
+        if not mark:
+            return newest, False
+        drop_old_entries(r.json(), mark)
+        return newest, bool(tweet_ids) and max(tweet_ids) <= mark
 
     async def _space_listener(self, chat: dict, frequency: int):
         rand_color = lambda: random.choice([RED, GREEN, RESET, BLUE, CYAN, MAGENTA, YELLOW])
         uri = f"wss://{URL(chat['endpoint']).host}/chatapi/v1/chatnow"
-        with open('chatlog.jsonl', 'ab') as fp:
-            async with websockets.connect(uri) as ws:
-                await ws.send(orjson.dumps({
-                    "payload": orjson.dumps({"access_token": chat['access_token']}).decode(),
-                    "kind": 3
-                }).decode())
-                await ws.send(orjson.dumps({
-                    "payload": orjson.dumps({
-                        "body": orjson.dumps({
-                            "room": chat['room_id']
-                        }).decode(),
-                        "kind": 1
+        async with websockets.connect(uri) as ws:
+            await ws.send(orjson.dumps({
+                "payload": orjson.dumps({"access_token": chat['access_token']}).decode(),
+                "kind": 3
+            }).decode())
+            await ws.send(orjson.dumps({
+                "payload": orjson.dumps({
+                    "body": orjson.dumps({
+                        "room": chat['room_id']
                     }).decode(),
-                    "kind": 2
-                }).decode())
-
-                prev_message = ''
-                prev_user = ''
-                while True:
-                    msg = await ws.recv()
-                    temp = orjson.loads(msg)
-                    kind = temp.get('kind')
-                    if kind == 1:
-                        signature = temp.get('signature')
-                        payload = orjson.loads(temp.get('payload'))
-                        payload['body'] = orjson.loads(payload.get('body'))
-                        res = {
-                            'kind': kind,
-                            'payload': payload,
-                            'signature': signature,
-                        }
-                        fp.write(orjson.dumps(res) + b'\n')
-                        body = payload['body']
-                        message = body.get('body')
-                        user = body.get('username')
-                        # user_id = body.get('user_id')
-                        final = body.get('final')
-
-                        if frequency == 1:
-                            if final:
-                                if user != prev_user:
-                                    print()
-                                    print(f"({rand_color()}{user}{RESET})")
-                                    prev_user = user
-                                # print(message, end=' ')
-                                print(message)
-
-                        # dirty
-                        if frequency == 2:
-                            if user and (not final):
-                                if user != prev_user:
-                                    print()
-                                    print(f"({rand_color()}{user}{RESET})")
-                                    prev_user = user
-                                new_message = re.sub(f'^({prev_message})', '', message, flags=re.I).strip()
-                                if len(new_message) < 100:
-                                    print(new_message, end=' ')
-                                    prev_message = message
+                    "kind": 1
+                }).decode(),
+                "kind": 2
+            }).decode())
+
+            prev_message = ''
+            prev_user = ''
+            while True:
+                msg = await ws.recv()
+                temp = orjson.loads(msg)
+                kind = temp.get('kind')
+                if kind == 1:
+                    signature = temp.get('signature')
+                    payload = orjson.loads(temp.get('payload'))
+                    payload['body'] = orjson.loads(payload.get('body'))
+                    res = {
+                        'kind': kind,
+                        'payload': payload,
+                        'signature': signature,
+                    }
+                    await self.writer.append('chatlog.jsonl', orjson.dumps(res) + b'\n')
+                    body = payload['body']
+                    message = body.get('body')
+                    user = body.get('username')
+                    # user_id = body.get('user_id')
+                    final = body.get('final')
+
+                    if frequency == 1:
+                        if final:
+                            if user != prev_user:
+                                print()
+                                print(f"({rand_color()}{user}{RESET})")
+                                prev_user = user
+                            # print(message, end=' ')
+                            print(message)
+
+                    # dirty
+                    if frequency == 2:
+                        if user and (not final):
+                            if user != prev_user:
+                                print()
+                                print(f"({rand_color()}{user}{RESET})")
+                                prev_user = user
+                            new_message = re.sub(f'^({prev_message})', '', message, flags=re.I).strip()
+                            if len(new_message) < 100:
+                                print(new_message, end=' ')
+                                prev_message = message
 
     async def _get_live_chats(self, client: Client, spaces: list[dict]):
         async def get(c: AsyncClient, space: dict) -> list[dict]:
@@ -739,13 +1254,13 @@ class Scraper:
             return r.json()
 
         limits = Limits(max_connections=100)
-        async with AsyncClient(headers=client.headers, limits=limits, timeout=30) as c:
+        async with make_async_client(self.retry, headers=client.headers, limits=limits, timeout=30) as c:
             tasks = (get(c, _id) for _id in spaces)
             if self.pbar:
                 return await tqdm_asyncio.gather(*tasks, desc='Getting live transcripts')
             return await asyncio.gather(*tasks)
 
-    def space_live_transcript(self, room: str, frequency: int = 1):
+    async def space_live_transcript(self, room: str, frequency: int = 1):
         """
         Log live transcript of a space
 
@@ -755,14 +1270,14 @@ class Scraper:
         """
 
         async def get(spaces: list[dict]):
-            client = init_session()
+            client = await asyncio.to_thread(init_session)
             chats = await self._get_live_chats(client, spaces)
             await asyncio.gather(*(self._space_listener(c, frequency) for c in chats))
 
-        spaces = self.spaces(rooms=[room])
-        asyncio.run(get(spaces))
+        spaces = await self.spaces(rooms=[room])
+        await get(spaces)
 
-    def spaces_live(self, rooms: list[str]):
+    async def spaces_live(self, rooms: list[str]):
         """
         Capture live audio stream from spaces
 
@@ -812,37 +1327,34 @@ class Scraper:
             if not playlist: return
             chunks = await get_chunks(client, playlist['url'])
             if not chunks: return
-            out = self.out / 'live'
-            out.mkdir(parents=True, exist_ok=True)
-            async with aiofiles.open(out / f'{playlist["room"]}.aac', 'wb') as fp:
-                while curr < lim:
-                    chunks = await get_chunks(client, playlist['url'])
-                    if not chunks:
-                        return {'space': space, 'chunks': sort_chunks(all_chunks)}
-                    new_chunks = set(chunks) - all_chunks
-                    all_chunks |= new_chunks
-                    for c in sort_chunks(new_chunks):
-                        try:
-                            if self.debug:
-                                self.logger.debug(f"write: chunk [{chunk_idx(c)}]\t{c}")
-                            r = await client.get(c)
-                            await fp.write(r.content)
-                        except Exception as e:
-                            if self.debug:
-                                self.logger.error(f'Failed to write chunk {c}\n{e}')
-                    curr = 0 if new_chunks else curr + 1
-                    # wait for new chunks. dynamic playlist is updated every 2-3 seconds
-                    await asyncio.sleep(random.random() + 1.5)
+            fname = self.out / 'live' / f'{playlist["room"]}.aac'
+            await self.writer.write(fname, b'')
+            while curr < lim:
+                chunks = await get_chunks(client, playlist['url'])
+                if not chunks:
+                    return {'space': space, 'chunks': sort_chunks(all_chunks)}
+                new_chunks = set(chunks) - all_chunks
+                all_chunks |= new_chunks
+                for c in sort_chunks(new_chunks):
+                    try:
+                        if self.debug:
+                            self.logger.debug(f"write: chunk [{chunk_idx(c)}]\t{c}")
+                        r = await client.get(c)
+                        await self.writer.append(fname, r.content)
+                    except Exception as e:
+                        if self.debug:
+                            self.logger.error(f'Failed to write chunk {c}\n{e}')
+                curr = 0 if new_chunks else curr + 1
+                # wait for new chunks. dynamic playlist is updated every 2-3 seconds
+                await asyncio.sleep(random.random() + 1.5)
             return {'space': space, 'chunks': sort_chunks(all_chunks)}
 
         async def process(spaces: list[dict]):
-            limits = Limits(max_connections=100)
-            headers, cookies = self.session.headers, self.session.cookies
-            async with AsyncClient(limits=limits, headers=headers, cookies=cookies, timeout=20) as c:
-                return await asyncio.gather(*(poll_space(c, space) for space in spaces))
+            c = self.clients.get('twitter.com')
+            return await asyncio.gather(*(poll_space(c, space) for space in spaces))
 
-        spaces = self.spaces(rooms=rooms)
-        return asyncio.run(process(spaces))
+        spaces = await self.spaces(rooms=rooms)
+        return await process(spaces)
 
     def _init_logger(self, **kwargs) -> Logger:
         if kwargs.get('debug'):
@@ -875,13 +1387,13 @@ class Scraper:
 
         # try validating cookies dict
         if isinstance(cookies, dict) and all(cookies.get(c) for c in {'ct0', 'auth_token'}):
-            _session = Client(cookies=cookies, follow_redirects=True)
+            _session = make_client(cookies=cookies, follow_redirects=True)
             _session.headers.update(get_headers(_session))
             return _session
 
         # try validating cookies from file
         if isinstance(cookies, str):
-            _session = Client(cookies=orjson.loads(Path(cookies).read_bytes()), follow_redirects=True)
+            _session = make_client(cookies=orjson.loads(Path(cookies).read_bytes()), follow_redirects=True)
             _session.headers.update(get_headers(_session))
             return _session
 
@@ -903,3 +1415,137 @@ class Scraper:
 
     def _v1_rate_limits(self):
         return self.session.get('https://api.twitter.com/1.1/application/rate_limit_status.json').json()
+
+
+def _shutdown(scraper: AsyncScraper, clients: ClientManager) -> None:
+    # drains queued writes and closes every store, also run at exit for scripts that never call `close()`
+    if clients.closed:
+        return
+    clients.run(scraper.aclose())
+    clients.close()
+
+
+async def _flushed(coro, writer: Writer):
+    try:
+        return await coro
+    finally:
+        await writer.flush()
+
+
+async def _peek(queries: Iterable | AsyncIterable) -> tuple[any, Iterable | AsyncIterable]:
+    """ First query, or None if there are none, and the queries with nothing consumed """
+    if isinstance(queries, AsyncIterable):
+        it = aiter(queries)
+        try:
+            first = await anext(it)
+        except StopAsyncIteration:
+            return None, []
+
+        async def rest():
+            yield first
+            async for q in it:
+                yield q
+
+        return first, rest()
+    if isinstance(queries, Sized):
+        return next(iter(queries), None), queries
+    it = iter(queries)
+    for first in it:
+        return first, chain((first,), it)
+    return None, []
+
+
+def _sync(fn: callable) -> callable:
+    @wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        # a sync call returns once its output is on disk, nothing is left queued when the script exits
+        return self.clients.run(_flushed(fn(self._scraper, *args, **kwargs), self.writer))
+
+    return wrapper
+
+
+def _sync_iter(fn: callable) -> callable:
+    @wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        agen = fn(self._scraper, *args, **kwargs)
+
+        async def step():
+            return await anext(agen)
+
+        try:
+            while True:
+                try:
+                    yield self.clients.run(step())
+                except StopAsyncIteration:
+                    return
+        finally:
+            # a generator dropped after `close()` has nothing left to clean up, the loop is gone
+            if not self.clients.closed:
+                self.clients.run(_flushed(agen.aclose(), self.writer))
+
+    return wrapper
+
+
+class Scraper:
+    """
+    Synchronous scraper
+
+    Thin wrapper around `AsyncScraper`, every call runs on one persistent event loop owned by this instance.
+    Attributes (`session`, `rate_limits`, `save`, ...) are shared with the wrapped `AsyncScraper`.
+    """
+
+    def __init__(self, email: str = None, username: str = None, password: str = None, session: Client = None, **kwargs):
+        object.__setattr__(self, '_scraper', AsyncScraper(email, username, password, session, **kwargs))
+        object.__setattr__(self, '_finalizer', weakref.finalize(self, _shutdown, self._scraper, self._scraper.clients))
+        if kwargs.get('preconnect'):
+            self.clients.run(self.clients.preconnect())
+
+    def __getattr__(self, name: str):
+        return getattr(self._scraper, name)
+
+    def __setattr__(self, name: str, value):
+        setattr(self._scraper, name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        """ Finish pending writes, close the shared HTTP clients, event loop and archive """
+        self._finalizer()
+
+    users = _sync(AsyncScraper.users)
+    tweets_by_id = _sync(AsyncScraper.tweets_by_id)
+    tweets_by_ids = _sync(AsyncScraper.tweets_by_ids)
+    tweets_details = _sync(AsyncScraper.tweets_details)
+    tweets = _sync(AsyncScraper.tweets)
+    tweets_and_replies = _sync(AsyncScraper.tweets_and_replies)
+    media = _sync(AsyncScraper.media)
+    likes = _sync(AsyncScraper.likes)
+    followers = _sync(AsyncScraper.followers)
+    following = _sync(AsyncScraper.following)
+    favoriters = _sync(AsyncScraper.favoriters)
+    retweeters = _sync(AsyncScraper.retweeters)
+    tweet_stats = _sync(AsyncScraper.tweet_stats)
+    users_by_ids = _sync(AsyncScraper.users_by_ids)
+    recommended_users = _sync(AsyncScraper.recommended_users)
+    profile_spotlights = _sync(AsyncScraper.profile_spotlights)
+    users_by_id = _sync(AsyncScraper.users_by_id)
+    user_ids = _sync(AsyncScraper.user_ids)
+    load_tweet = _sync(AsyncScraper.load_tweet)
+    load_user = _sync(AsyncScraper.load_user)
+    download_media = _sync(AsyncScraper.download_media)
+    trends = _sync(AsyncScraper.trends)
+    spaces = _sync(AsyncScraper.spaces)
+    space_live_transcript = _sync(AsyncScraper.space_live_transcript)
+    spaces_live = _sync(AsyncScraper.spaces_live)
+    iter_tweets = _sync_iter(AsyncScraper.iter_tweets)
+    iter_tweets_and_replies = _sync_iter(AsyncScraper.iter_tweets_and_replies)
+    iter_media = _sync_iter(AsyncScraper.iter_media)
+    iter_likes = _sync_iter(AsyncScraper.iter_likes)
+    iter_followers = _sync_iter(AsyncScraper.iter_followers)
+    iter_following = _sync_iter(AsyncScraper.iter_following)
+    iter_favoriters = _sync_iter(AsyncScraper.iter_favoriters)
+    iter_retweeters = _sync_iter(AsyncScraper.iter_retweeters)
@@ -2,7 +2,6 @@ import asyncio
 import logging.config
 import math
 import platform
-import random
 import re
 import time
 from logging import Logger
@@ -11,9 +10,13 @@ from pathlib import Path
 import orjson
 from httpx import AsyncClient, Client
 
+from .archive import open_archive
 from .constants import *
 from .login import login
-from .util import get_headers, find_key, build_params
+from .seen import CAPACITY, open_seen
+from .transport import RetryPolicy, make_async_client, make_client
+from .util import get_headers, PathCache, RequestTemplate, drop_entries, timeline_items
+from .writer import Writer
 
 reset = '\x1b[0m'
 colors = [f'\x1b[{i}m' for i in range(31, 37)]
@@ -34,6 +37,9 @@ if platform.system() != 'Windows':
     except ImportError as e:
         ...
 
+# search sends its own variables instead of the defaults, and asks for article content to be left out
+SEARCH_TEMPLATE = RequestTemplate(Operation.SearchTimeline, variables={}, fieldToggles={'withArticleRichContentState': False})
+
 
 class Search:
     def __init__(self, email: str = None, username: str = None, password: str = None, session: Client = None, **kwargs):
@@ -41,15 +47,35 @@ class Search:
         self.debug = kwargs.get('debug', 0)
         self.logger = self._init_logger(**kwargs)
         self.session = self._validate_session(email, username, password, session, **kwargs)
-
-    def run(self, queries: list[dict], limit: int = math.inf, out: str = 'data/search_results', **kwargs):
-        out = Path(out)
+        self.paths = PathCache(kwargs.get('verify_paths', 100))
+        # transient failures (5xx, timeouts, dropped connections, short 429s) are retried by the client, see `transport.RetryPolicy`
+        self.retry = kwargs.get('retry') or RetryPolicy(logger=self.logger if self.debug else None)
+        self.out = Path(kwargs.get('out', 'data/search_results'))
+        # segment archive replacing the per-page json files, `{out}/archive` by default
+        self.archive = open_archive(kwargs.get('archive'), self.out / 'archive', compress=kwargs.get('compress', False))
+        self.writer = Writer(kwargs.get('write_queue', 1024), fsync=kwargs.get('fsync'), logger=self.logger)
+        # `{out}/seen` by default, shared with Scraper when pointed at the same directory
+        self.seen = open_seen(kwargs.get('seen'), self.out / 'seen', capacity=kwargs.get('seen_capacity', CAPACITY))
+
+    def run(self, queries: list[dict], limit: int = math.inf, out: str = None, **kwargs):
+        out = Path(out) if out else self.out
         out.mkdir(parents=True, exist_ok=True)
-        return asyncio.run(self.process(queries, limit, out, **kwargs))
+        try:
+            return asyncio.run(self.process(queries, limit, out, **kwargs))
+        finally:
+            if self.archive:
+                self.archive.flush()
+            if self.seen is not None:
+                self.seen.flush()
 
     async def process(self, queries: list[dict], limit: int, out: Path, **kwargs) -> list:
-        async with AsyncClient(headers=get_headers(self.session)) as s:
-            return await asyncio.gather(*(self.paginate(s, q, limit, out, **kwargs) for q in queries))
+        try:
+            # `retries` of a run overrides the number of attempts of the transport's retry policy
+            policy = RetryPolicy(retries=kwargs.pop('retries'), logger=self.retry.logger) if 'retries' in kwargs else self.retry
+            async with make_async_client(policy, headers=get_headers(self.session)) as s:
+                return await asyncio.gather(*(self.paginate(s, q, limit, out, **kwargs) for q in queries))
+        finally:
+            await self.writer.aclose()
 
     async def paginate(self, client: AsyncClient, query: dict, limit: int, out: Path, **kwargs) -> list[dict]:
         params = {
@@ -59,8 +85,6 @@ class Search:
                 'rawQuery': query['query'],
                 'product': query['category']
             },
-            'features': Operation.default_features,
-            'fieldToggles': {'withArticleRichContentState': False},
         }
 
         res = []
@@ -69,56 +93,58 @@ class Search:
         while True:
             if cursor:
                 params['variables']['cursor'] = cursor
-            data, entries, cursor = await self.backoff(lambda: self.get(client, params), **kwargs)
+            # transient failures are retried by the client's transport, anything that still fails ends this query
+            try:
+                data, entries, page = await self.get(client, params)
+            except Exception as e:
+                if self.debug:
+                    self.logger.error(f'Failed to get search results for {query["query"]}\n{e}')
+                return res
+            if errors := data.get('errors'):
+                if self.debug:
+                    for e in errors:
+                        self.logger.warning(f'{YELLOW}{e.get("message")}{RESET}')
+                return res
+            prev, cursor = cursor, page.cursor
             res.extend(entries)
             if len(entries) <= 2 or len(total) >= limit:  # just cursors
                 if self.debug:
                     self.logger.debug(f'[{GREEN}success{RESET}] Returned {len(total)} search results for {query["query"]}')
                 return res
-            total |= set(find_key(entries, 'entryId'))
+            total |= {e['entryId'] for e in entries}
             if self.debug:
                 self.logger.debug(f'{query["query"]}')
-            if self.save:
-                (out / f'{time.time_ns()}.json').write_bytes(orjson.dumps(entries))
+            if self.save and not self.archive:
+                # with an archive the raw pages are already appended to it by `get`
+                await self.writer.write(out / f'{time.time_ns()}.json', orjson.dumps(entries))
+            if not cursor or cursor == prev:
+                # no way forward, asking again with the same cursor would return the same page
+                if self.debug:
+                    self.logger.debug(f'[{GREEN}success{RESET}] Returned {len(total)} search results for {query["query"]} (end of cursors)')
+                return res
 
     async def get(self, client: AsyncClient, params: dict) -> tuple:
-        _, qid, name = Operation.SearchTimeline
-        r = await client.get(f'https://twitter.com/i/api/graphql/{qid}/{name}', params=build_params(params))
+        name = Operation.SearchTimeline[-1]
+        r = await client.get(SEARCH_TEMPLATE.url(params['variables']))
         data = r.json()
-        cursor = self.get_cursor(data)
-        entries = [y for x in find_key(data, 'entries') for y in x if re.search(r'^(tweet|user)-', y['entryId'])]
+        content, new = r.content, None
+        if self.seen is not None and (items := timeline_items(data)):
+            # results already returned by earlier searches are dropped, a page of only known results ends the search
+            if known := await asyncio.to_thread(self.seen.known, items):
+                drop_entries(data, lambda kind, i: (kind, i) in known)
+                content = orjson.dumps(data)
+            new = [x for x in dict.fromkeys(items) if x not in known]
+        if self.save and self.archive:
+            variables = {k: v for k, v in params['variables'].items() if k != 'cursor'}
+            await self.writer.call(self.archive.append, name, content, variables, params['variables'].get('cursor'))
+        if new:
+            await self.writer.call(self.seen.add, new)
+        page = self.paths.extract(name, data)
+        entries = [e for e in page.entries if re.search(r'^(tweet|user)-', e['entryId'])]
         # add on query info
         for e in entries:
             e['query'] = params['variables']['rawQuery']
-        return data, entries, cursor
-
-    def get_cursor(self, data: list[dict]):
-        for e in find_key(data, 'content'):
-            if e.get('cursorType') == 'Bottom':
-                return e['value']
-
-    async def backoff(self, fn, **kwargs):
-        retries = kwargs.get('retries', 3)
-        for i in range(retries + 1):
-            try:
-                data, entries, cursor = await fn()
-                if errors := data.get('errors'):
-                    for e in errors:
-                        if self.debug:
-                            self.logger.warning(f'{YELLOW}{e.get("message")}{RESET}')
-                        return [], [], ''
-                ids = set(find_key(data, 'entryId'))
-                if len(ids) >= 2:
-                    return data, entries, cursor
-            except Exception as e:
-                if i == retries:
-                    if self.debug:
-                        self.logger.debug(f'Max retries exceeded\n{e}')
-                    return
-                t = 2 ** i + random.random()
-                if self.debug:
-                    self.logger.debug(f'Retrying in {f"{t:.2f}"} seconds\t\t{e}')
-                await asyncio.sleep(t)
+        return data, entries, page
 
     def _init_logger(self, **kwargs) -> Logger:
         if kwargs.get('debug'):
@@ -152,13 +178,13 @@ class Search:
 
         # try validating cookies dict
         if isinstance(cookies, dict) and all(cookies.get(c) for c in {'ct0', 'auth_token'}):
-            _session = Client(cookies=cookies, follow_redirects=True)
+            _session = make_client(cookies=cookies, follow_redirects=True)
             _session.headers.update(get_headers(_session))
             return _session
 
         # try validating cookies from file
         if isinstance(cookies, str):
-            _session = Client(cookies=orjson.loads(Path(cookies).read_bytes()), follow_redirects=True)
+            _session = make_client(cookies=orjson.loads(Path(cookies).read_bytes()), follow_redirects=True)
             _session.headers.update(get_headers(_session))
             return _session
 
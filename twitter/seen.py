@@ -0,0 +1,157 @@
+import math
+import mmap
+import sqlite3
+import struct
+import threading
+from pathlib import Path
+
+CAPACITY = 100_000_000  # ids per kind before the false positive rate degrades
+ERROR_RATE = 0.01
+
+_MAGIC = b'TWBLOOM1'
+_HEADER = struct.Struct('<8sQQ')  # magic, bits, hashes
+_MASK = (1 << 64) - 1
+
+
+def _mix(x: int) -> int:
+    # splitmix64 finalizer
+    x = (x + 0x9E3779B97F4A7C15) & _MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
+
+
+class BloomFilter:
+    """
+    Bloom filter over integer ids, memory-mapped from a file
+
+    Only the pages that are touched are loaded, so memory is bounded by the OS page cache rather than by the
+    number of ids. The file is created sparse and sized for `capacity` ids at `error_rate`, an existing
+    file keeps the parameters it was created with.
+    """
+
+    def __init__(self, path: str | Path, capacity: int = CAPACITY, error_rate: float = ERROR_RATE):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if not path.exists() or path.stat().st_size < _HEADER.size:
+            bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+            bits = (bits + 7) // 8 * 8
+            hashes = max(1, round(bits / capacity * math.log(2)))
+            with path.open('wb') as fp:
+                fp.write(_HEADER.pack(_MAGIC, bits, hashes))
+                fp.truncate(_HEADER.size + bits // 8)
+        self.fp = path.open('r+b')
+        self.mm = mmap.mmap(self.fp.fileno(), 0)
+        magic, self.bits, self.hashes = _HEADER.unpack_from(self.mm)
+        if magic != _MAGIC:
+            raise ValueError(f'Not a bloom filter: {path}')
+
+    def _positions(self, x: int):
+        h1 = _mix(x)
+        h2 = _mix(h1) | 1
+        for i in range(self.hashes):
+            yield _HEADER.size * 8 + (h1 + i * h2) % self.bits
+
+    def add(self, x: int) -> None:
+        mm = self.mm
+        for p in self._positions(x):
+            mm[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, x: int) -> bool:
+        mm = self.mm
+        return all(mm[p >> 3] & (1 << (p & 7)) for p in self._positions(x))
+
+    def flush(self) -> None:
+        self.mm.flush()
+
+    def close(self) -> None:
+        self.mm.flush()
+        self.mm.close()
+        self.fp.close()
+
+
+class SeenStore:
+    """
+    Persistent set of tweet and user ids already fetched, shared across runs and jobs
+
+    Each kind has a Bloom filter answering "definitely new" without touching disk for most ids, and an exact
+    SQLite table confirming the (rare) positives, so a false positive never drops a new item.
+
+        {root}/{kind}.bloom
+        {root}/seen.db
+    """
+
+    KINDS = ('tweet', 'user')
+
+    def __init__(self, root: str | Path = 'data/seen', capacity: int = CAPACITY, error_rate: float = ERROR_RATE):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.blooms = {k: BloomFilter(self.root / f'{k}.bloom', capacity, error_rate) for k in self.KINDS}
+        self.conn = sqlite3.connect(self.root / 'seen.db', check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        for k in self.KINDS:
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS {k} (id INTEGER PRIMARY KEY)')
+        self.lock = threading.Lock()
+
+    def known(self, items: list[tuple[str, int]]) -> set[tuple[str, int]]:
+        """
+        Items that were seen before
+
+        @param items: list of ("tweet" | "user", id)
+        @return: set of the items already in the store
+        """
+        with self.lock:
+            maybe = [(k, i) for k, i in items if k in self.blooms and i in self.blooms[k]]
+            res = set()
+            for k in self.KINDS:
+                if ids := [i for kind, i in maybe if kind == k]:
+                    rows = self.conn.execute(f'SELECT id FROM {k} WHERE id IN ({",".join("?" * len(ids))})', ids).fetchall()
+                    res |= {(k, i) for i, in rows}
+        return res
+
+    def add(self, items: list[tuple[str, int]]) -> None:
+        """ Add items, committed in one transaction """
+        if not items:
+            return
+        with self.lock:
+            self.conn.execute('BEGIN')
+            for k in self.KINDS:
+                if ids := [(i,) for kind, i in items if kind == k]:
+                    self.conn.executemany(f'INSERT OR IGNORE INTO {k} VALUES (?)', ids)
+            self.conn.execute('COMMIT')
+            # bits are set after the commit, a crash in between only lets these items through once more
+            for k, i in items:
+                if k in self.blooms:
+                    self.blooms[k].add(i)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return sum(self.conn.execute(f'SELECT COUNT(*) FROM {k}').fetchone()[0] for k in self.KINDS)
+
+    def flush(self) -> None:
+        with self.lock:
+            for b in self.blooms.values():
+                b.flush()
+
+    def close(self) -> None:
+        with self.lock:
+            for b in self.blooms.values():
+                b.close()
+            self.conn.close()
+
+
+def open_seen(seen: bool | str | Path | SeenStore, root: str | Path, **kwargs) -> SeenStore | None:
+    """
+    Resolve the `seen` option of Scraper
+
+    @param seen: False/None to disable, True for the default location, a path, or an existing SeenStore
+    @param root: default store directory
+    @param kwargs: SeenStore options, e.g. `capacity`
+    @return: SeenStore or None
+    """
+    if not seen:
+        return None
+    if isinstance(seen, SeenStore):
+        return seen
+    return SeenStore(root if seen is True else seen, **kwargs)
@@ -0,0 +1,317 @@
+import asyncio
+import ipaddress
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from functools import partial
+from logging import Logger
+from typing import Callable
+from urllib.request import getproxies
+
+import httpx
+
+from .breaker import CircuitBreaker, failed
+
+RETRY_STATUS = {500, 502, 503, 504}
+RATE_LIMITED = 429
+IDEMPOTENT = {'GET', 'HEAD', 'OPTIONS'}
+# failures before the request reached the server, safe to retry for any method
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+RETRY_ERRORS = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+
+# options of the default transport that must be passed to it rather than to the client when a transport is given
+TRANSPORT_OPTIONS = ('verify', 'cert', 'trust_env', 'http1', 'http2', 'limits', 'proxy')
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """ Exponential backoff with full jitter: uniform in [0, min(cap, base * 2 ** attempt)] """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def operation_name(request: httpx.Request) -> str:
+    """ GraphQL operation name of a request, or its host for everything else """
+    path = request.url.path
+    if '/graphql/' in path:
+        return path.rsplit('/', 1)[-1]
+    return request.url.host
+
+
+class RetryPolicy:
+    """
+    Retry settings, per-operation retry budgets and metrics, shared by every transport it is given to
+
+    Idempotent requests are retried on 5xx, 429, timeouts and dropped connections. Any request is retried when
+    the connection could not be established. Waits use jittered exponential backoff unless the server says how
+    long to wait (`Retry-After`, or `x-rate-limit-reset` on 429). Waits longer than `max_wait` are not
+    attempted, so the response goes back to the caller.
+
+    Each operation has a retry budget, a token bucket holding up to `min_retries` tokens and refilled by
+    `budget_ratio` tokens per request. When an operation fails persistently, its retries stop at about
+    `budget_ratio` of its traffic instead of multiplying it.
+    """
+
+    def __init__(self, retries: int = 5, backoff: float = 0.5, max_backoff: float = 30.0, max_wait: float = 60.0,
+                 budget_ratio: float = 0.2, min_retries: int = 10, statuses: set[int] = None, logger: Logger = None):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_wait = max_wait
+        self.budget_ratio = budget_ratio
+        self.min_retries = min_retries
+        self.statuses = RETRY_STATUS | {RATE_LIMITED} if statuses is None else statuses
+        self.logger = logger
+        self.budgets = {}  # operation -> tokens
+        self.metrics = {}  # operation -> {'requests', 'retries', 'exhausted', 'failures'}
+        self._lock = threading.Lock()  # sync clients may be used from several threads
+
+    def _stats(self, op: str) -> dict:
+        if (s := self.metrics.get(op)) is None:
+            s = self.metrics[op] = {'requests': 0, 'retries': 0, 'exhausted': 0, 'failures': 0}
+        return s
+
+    def started(self, op: str) -> None:
+        with self._lock:
+            self._stats(op)['requests'] += 1
+            self.budgets[op] = min(self.min_retries, self.budgets.get(op, self.min_retries) + self.budget_ratio)
+
+    def failed(self, op: str) -> None:
+        """ A request failed for good, after any retries """
+        with self._lock:
+            self._stats(op)['failures'] += 1
+
+    def _withdraw(self, op: str) -> bool:
+        with self._lock:
+            if self.budgets.get(op, self.min_retries) < 1:
+                self._stats(op)['exhausted'] += 1
+                return False
+            self.budgets[op] = self.budgets.get(op, self.min_retries) - 1
+            self._stats(op)['retries'] += 1
+            return True
+
+    def wait(self, attempt: int, response: httpx.Response = None) -> float:
+        """ Seconds to wait before the next attempt, honouring server hints """
+        if response is not None:
+            if (retry_after := response.headers.get('retry-after')) is not None:
+                try:
+                    return max(0.0, float(retry_after))
+                except ValueError:
+                    try:
+                        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+                    except (TypeError, ValueError):
+                        ...
+            if response.status_code == RATE_LIMITED and (reset := response.headers.get('x-rate-limit-reset')):
+                try:
+                    return max(0.0, int(reset) - time.time()) + random.random()
+                except ValueError:
+                    ...
+        return backoff_delay(attempt, self.backoff, self.max_backoff)
+
+    def retry(self, request: httpx.Request, attempt: int, response: httpx.Response = None, error: Exception = None) -> float | None:
+        """
+        Decide whether to retry a failed attempt
+
+        @param request: request that failed
+        @param attempt: number of retries so far
+        @param response: response, if one was received
+        @param error: exception raised by the transport, if any
+        @return: seconds to wait before retrying, or None to give up
+        """
+        if attempt >= self.retries:
+            return None
+        if error is not None:
+            if not isinstance(error, CONNECT_ERRORS) and (request.method not in IDEMPOTENT or not isinstance(error, RETRY_ERRORS)):
+                return None
+        elif response.status_code not in self.statuses or request.method not in IDEMPOTENT:
+            return None
+        t = self.wait(attempt, response)
+        if t > self.max_wait:
+            return None
+        op = operation_name(request)
+        if not self._withdraw(op):
+            return None
+        if self.logger:
+            reason = f'{type(error).__name__}: {error}' if error is not None else response.status_code
+            self.logger.debug(f'{op} retry {attempt + 1}/{self.retries} in {t:.2f}s ({reason})')
+        return t
+
+
+class AsyncRetryTransport(httpx.AsyncBaseTransport):
+    """ Wraps an async transport, retrying failed attempts according to a `RetryPolicy`, behind an optional `CircuitBreaker` """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport = None, policy: RetryPolicy = None, breaker: CircuitBreaker = None, **kwargs):
+        self.transport = transport or httpx.AsyncHTTPTransport(**kwargs)
+        self.policy = policy or DEFAULT_POLICY
+        self.breaker = breaker
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.breaker is None:
+            return await self._send(request)
+        op = operation_name(request)
+        probe = await self.breaker.wait(op)
+        ok = None
+        try:
+            response = await self._send(request)
+            ok = not failed(response)
+            return response
+        except httpx.TransportError:
+            ok = False
+            raise
+        finally:
+            self.breaker.record(op, ok, probe)
+
+    async def _send(self, request: httpx.Request) -> httpx.Response:
+        policy = self.policy
+        policy.started(operation_name(request))
+        attempt = 0
+        while True:
+            try:
+                response = await self.transport.handle_async_request(request)
+            except Exception as e:
+                if (t := policy.retry(request, attempt, error=e)) is None:
+                    policy.failed(operation_name(request))
+                    raise
+            else:
+                if response.status_code < 400 or (t := policy.retry(request, attempt, response)) is None:
+                    if response.status_code >= 500:
+                        policy.failed(operation_name(request))
+                    return response
+                await response.aclose()
+            await asyncio.sleep(t)
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class RetryTransport(httpx.BaseTransport):
+    """ Wraps a sync transport, retrying failed attempts according to a `RetryPolicy`, behind an optional `CircuitBreaker` """
+
+    def __init__(self, transport: httpx.BaseTransport = None, policy: RetryPolicy = None, breaker: CircuitBreaker = None, **kwargs):
+        self.transport = transport or httpx.HTTPTransport(**kwargs)
+        self.policy = policy or DEFAULT_POLICY
+        self.breaker = breaker
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.breaker is None:
+            return self._send(request)
+        op = operation_name(request)
+        probe = self.breaker.wait_sync(op)
+        ok = None
+        try:
+            response = self._send(request)
+            ok = not failed(response)
+            return response
+        except httpx.TransportError:
+            ok = False
+            raise
+        finally:
+            self.breaker.record(op, ok, probe)
+
+    def _send(self, request: httpx.Request) -> httpx.Response:
+        policy = self.policy
+        policy.started(operation_name(request))
+        attempt = 0
+        while True:
+            try:
+                response = self.transport.handle_request(request)
+            except Exception as e:
+                if (t := policy.retry(request, attempt, error=e)) is None:
+                    policy.failed(operation_name(request))
+                    raise
+            else:
+                if response.status_code < 400 or (t := policy.retry(request, attempt, response)) is None:
+                    if response.status_code >= 500:
+                        policy.failed(operation_name(request))
+                    return response
+                response.close()
+            time.sleep(t)
+            attempt += 1
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+# used by clients that are not given a policy of their own
+DEFAULT_POLICY = RetryPolicy()
+
+
+def _split(kwargs: dict) -> tuple[dict, dict]:
+    return {k: v for k, v in kwargs.items() if k not in TRANSPORT_OPTIONS}, {k: kwargs[k] for k in TRANSPORT_OPTIONS if k in kwargs}
+
+
+def environment_proxies() -> dict[str, str | None]:
+    """
+    Proxy mounts from HTTP(S)_PROXY/ALL_PROXY/NO_PROXY, following the same rules as httpx
+
+    @return: dict of url pattern -> proxy url, or None for hosts that bypass the proxy
+    """
+    info = getproxies()
+    mounts = {}
+    for scheme in ('http', 'https', 'all'):
+        if url := info.get(scheme):
+            mounts[f'{scheme}://'] = url if '://' in url else f'http://{url}'
+    for host in (h.strip() for h in info.get('no', '').split(',')):
+        if host == '*':
+            return {}
+        if not host:
+            continue
+        if '://' in host:
+            mounts[host] = None
+        elif host.lower() == 'localhost' or _is_ip(host, 4):
+            mounts[f'all://{host}'] = None
+        elif _is_ip(host, 6):
+            mounts[f'all://[{host}]'] = None
+        else:
+            mounts[f'all://*{host}'] = None
+    return mounts
+
+
+def _is_ip(host: str, version: int) -> bool:
+    try:
+        return ipaddress.ip_address(host.split('/')[0]).version == version
+    except ValueError:
+        return False
+
+
+def _mounts(kwargs: dict, transport_kwargs: dict, make: Callable) -> dict | None:
+    # passing a transport turns off httpx's own env proxy handling, so proxied routes get their own wrapped transports
+    if transport_kwargs.get('proxy') is not None or not transport_kwargs.get('trust_env', True):
+        return kwargs.get('mounts')
+    options = {k: v for k, v in transport_kwargs.items() if k != 'proxy'}
+    mounts = {pattern: None if url is None else make(proxy=url, **options) for pattern, url in environment_proxies().items()}
+    return (mounts | kwargs.get('mounts', {})) or None
+
+
+def make_async_client(policy: RetryPolicy = None, breaker: CircuitBreaker = None, **kwargs) -> httpx.AsyncClient:
+    """
+    AsyncClient whose requests go through an `AsyncRetryTransport`
+
+    Proxies from the environment are honoured like in a plain AsyncClient, unless `proxy` is given or `trust_env=False`.
+
+    @param policy: retry policy, defaults to the shared `DEFAULT_POLICY`
+    @param breaker: optional per-operation circuit breaker
+    @param kwargs: AsyncClient options, transport options (`limits`, `http2`, `verify`, ...) are applied to the wrapped transport
+    @return: AsyncClient
+    """
+    client_kwargs, transport_kwargs = _split(kwargs)
+    make = partial(AsyncRetryTransport, policy=policy, breaker=breaker)
+    client_kwargs['mounts'] = _mounts(kwargs, transport_kwargs, make)
+    return httpx.AsyncClient(transport=make(**transport_kwargs), **client_kwargs)
+
+
+def make_client(policy: RetryPolicy = None, breaker: CircuitBreaker = None, **kwargs) -> httpx.Client:
+    """
+    Client whose requests go through a `RetryTransport`
+
+    Proxies from the environment are honoured like in a plain Client, unless `proxy` is given or `trust_env=False`.
+
+    @param policy: retry policy, defaults to the shared `DEFAULT_POLICY`
+    @param breaker: optional per-operation circuit breaker
+    @param kwargs: Client options, transport options (`limits`, `http2`, `verify`, ...) are applied to the wrapped transport
+    @return: Client
+    """
+    client_kwargs, transport_kwargs = _split(kwargs)
+    make = partial(RetryTransport, policy=policy, breaker=breaker)
+    client_kwargs['mounts'] = _mounts(kwargs, transport_kwargs, make)
+    return httpx.Client(transport=make(**transport_kwargs), **client_kwargs)
@@ -0,0 +1,134 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+MAX_AGE = 30 * 24 * 60 * 60  # seconds, screen names rarely change
+
+
+def find_users(data: dict | list) -> dict[str, int]:
+    """
+    Collect (screen_name, user id) pairs from every user object in GraphQL response data
+
+    @param data: GraphQL response data
+    @return: dict of screen name -> user id
+    """
+    res = {}
+    stack = [data]
+    pop, push = stack.pop, stack.append
+    while stack:
+        o = pop()
+        if type(o) is dict:
+            if o.get('__typename') == 'User' and (rest_id := o.get('rest_id')):
+                # newer responses moved screen_name from `legacy` to `core`
+                name = (o.get('core') or {}).get('screen_name') or (o.get('legacy') or {}).get('screen_name')
+                if name and rest_id.isdigit():
+                    res[name] = int(rest_id)
+            children = o.values()
+        elif type(o) is list:
+            children = o
+        else:
+            continue
+        for v in children:
+            if type(v) is dict or type(v) is list:
+                push(v)
+    return res
+
+
+class UserIndex:
+    """
+    Persistent, case-insensitive screen_name <-> user id index
+
+    Filled from every user object seen in any response, so most screen names can be resolved without
+    spending `UserByScreenName` requests. Entries older than `max_age` seconds are treated as unknown.
+    Pass `path=None` for an in-memory index.
+    """
+
+    def __init__(self, path: str | Path = None, max_age: float = MAX_AGE):
+        if path:
+            path = Path(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age
+        self.conn = sqlite3.connect(path or ':memory:', check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS users (name TEXT PRIMARY KEY, screen_name TEXT, user_id INTEGER, updated REAL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS users_user_id ON users (user_id)')
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+    def add(self, users: dict[str, int]) -> None:
+        """
+        Add or refresh screen name -> user id mappings
+
+        @param users: dict of screen name -> user id
+        """
+        if not users:
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.execute('BEGIN')
+            # a screen name can move to another account, an account can change its screen name
+            self.conn.executemany('DELETE FROM users WHERE user_id = ? AND name != ?', ((i, s.lower()) for s, i in users.items()))
+            self.conn.executemany('INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?)', ((s.lower(), s, i, now) for s, i in users.items()))
+            self.conn.execute('COMMIT')
+
+    def observe(self, data: dict | list) -> None:
+        """ Index every user object in GraphQL response data """
+        self.add(find_users(data))
+
+    def user_ids(self, screen_names: list[str]) -> dict[str, int]:
+        """
+        Look up fresh user ids
+
+        @param screen_names: screen names, any case
+        @return: dict of screen name (as given) -> user id, unknown or stale names are omitted
+        """
+        names = {s.lower(): s for s in screen_names}
+        res = {}
+        with self.lock:
+            for chunk in (list(names)[i:i + 500] for i in range(0, len(names), 500)):
+                rows = self.conn.execute(
+                    f'SELECT name, user_id FROM users WHERE updated >= ? AND name IN ({",".join("?" * len(chunk))})',
+                    (time.time() - self.max_age, *chunk),
+                ).fetchall()
+                res |= {names[name]: user_id for name, user_id in rows}
+        return res
+
+    def screen_names(self, user_ids: list[int]) -> dict[int, str]:
+        """
+        Look up fresh screen names
+
+        @param user_ids: user ids
+        @return: dict of user id -> screen name, unknown or stale ids are omitted
+        """
+        ids = [int(i) for i in user_ids]
+        res = {}
+        with self.lock:
+            for chunk in (ids[i:i + 500] for i in range(0, len(ids), 500)):
+                rows = self.conn.execute(
+                    f'SELECT user_id, screen_name FROM users WHERE updated >= ? AND user_id IN ({",".join("?" * len(chunk))})',
+                    (time.time() - self.max_age, *chunk),
+                ).fetchall()
+                res |= dict(rows)
+        return res
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def open_user_index(index: bool | str | Path | UserIndex, **kwargs) -> UserIndex | None:
+    """
+    Resolve the `user_index` option of Scraper
+
+    @param index: False/None to disable, True for in-memory, a path for a persistent SQLite index, or an existing UserIndex
+    @param kwargs: UserIndex options, e.g. `max_age`
+    @return: UserIndex or None
+    """
+    if not index:
+        return None
+    if isinstance(index, UserIndex):
+        return index
+    return UserIndex(None if index is True else index, **kwargs)
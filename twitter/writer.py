@@ -0,0 +1,156 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from logging import Logger
+from pathlib import Path
+from typing import Callable
+
+WRITE, APPEND, CALL = 0, 1, 2
+
+
+class Writer:
+    """
+    Shared background writer for all disk output
+
+    Producers enqueue bytes and return immediately, a single background task drains the queue in batches
+    and hands each batch to a worker thread, so the event loop never blocks on file I/O. Within a batch,
+    writes to the same file are coalesced into one `write` call and append handles are kept open between
+    batches. The queue is bounded: when disk falls behind, producers wait, which slows down fetching.
+
+    `fsync` sets the durability cadence: None never fsyncs (left to the OS), 0 fsyncs after every batch,
+    and N > 0 fsyncs files written to at most every N seconds.
+    """
+
+    def __init__(self, maxsize: int = 1024, batch_size: int = 256, fsync: float | None = None, max_open: int = 64, logger: Logger = None):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.max_open = max_open
+        self.logger = logger
+        self._queue = None
+        self._task = None
+        self._files = OrderedDict()  # open append handles, LRU
+        self._dirty = set()
+        self._last_sync = time.monotonic()
+
+    def _start(self) -> asyncio.Queue:
+        if self._task is None or self._task.done():
+            # bound to the loop of the first producer, `aclose` resets it
+            self._queue = asyncio.Queue(self.maxsize)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._queue
+
+    async def write(self, path: str | Path, data: bytes) -> None:
+        """ Replace the contents of a file, parent directories are created as needed """
+        await self._start().put((WRITE, Path(path), data))
+
+    async def append(self, path: str | Path, data: bytes) -> None:
+        """ Append to a file, parent directories are created as needed """
+        await self._start().put((APPEND, Path(path), data))
+
+    async def call(self, fn: Callable, *args) -> None:
+        """ Run a blocking callable on the writer thread, in order with the other writes """
+        await self._start().put((CALL, fn, args))
+
+    async def flush(self) -> None:
+        """ Wait until everything enqueued so far has been written """
+        if self._queue is not None and self._task is not None and not self._task.done():
+            await self._queue.join()
+
+    async def aclose(self) -> None:
+        """ Write everything still queued, then stop the background task and close all files """
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = self._queue = None
+        try:
+            await asyncio.to_thread(self._close_files)
+        except RuntimeError:
+            # the default executor is already shut down when this runs at interpreter exit
+            self._close_files()
+
+    async def _run(self):
+        q = self._queue
+        while True:
+            batch = [await q.get()]
+            while len(batch) < self.batch_size and not q.empty():
+                batch.append(q.get_nowait())
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f'Failed to write batch\n{e}')
+            finally:
+                for _ in batch:
+                    q.task_done()
+
+    def _write_batch(self, batch: list[tuple]) -> None:
+        # coalesce writes to the same file into a single write call, keeping order per file
+        pending = {}
+        for kind, target, data in batch:
+            if kind == CALL:
+                self._flush_pending(pending)
+                self._safe(target, *data)
+            elif kind == WRITE or target not in pending:
+                pending[target] = [kind, [data]]  # a full write discards earlier writes to the file in this batch
+            else:
+                pending[target][1].append(data)
+        self._flush_pending(pending)
+        if self.fsync is not None and self._dirty and time.monotonic() - self._last_sync >= self.fsync:
+            for path in list(self._dirty):
+                if fp := self._files.get(path):
+                    self._sync(path, fp)
+            self._last_sync = time.monotonic()
+
+    def _flush_pending(self, pending: dict) -> None:
+        for path, (kind, chunks) in pending.items():
+            self._safe(self._write, path, kind, b''.join(chunks))
+        pending.clear()
+
+    def _safe(self, fn: Callable, *args) -> None:
+        try:
+            fn(*args)
+        except Exception as e:
+            msg = f'Failed to write {args[0] if args else fn}\n{e}'
+            if self.logger:
+                self.logger.error(msg)
+            else:
+                print(msg)
+
+    def _write(self, path: Path, kind: int, data: bytes) -> None:
+        fp = self._files.pop(path, None)
+        if kind == WRITE or fp is None:
+            if fp:
+                fp.close()
+            fp = self._open(path, 'wb' if kind == WRITE else 'ab')
+        fp.write(data)
+        fp.flush()
+        self._files[path] = fp  # most recently used last
+        if self.fsync is not None:
+            self._dirty.add(path)
+        while len(self._files) > self.max_open:
+            old, f = self._files.popitem(last=False)
+            self._sync(old, f)
+            f.close()
+
+    def _sync(self, path: Path, fp) -> None:
+        if path in self._dirty:
+            os.fsync(fp.fileno())
+            self._dirty.discard(path)
+
+    @staticmethod
+    def _open(path: Path, mode: str):
+        try:
+            return path.open(mode)
+        except FileNotFoundError:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            return path.open(mode)
+
+    def _close_files(self) -> None:
+        for path, fp in self._files.items():
+            self._sync(path, fp)
+            fp.close()
+        self._files.clear()
+        self._dirty.clear()